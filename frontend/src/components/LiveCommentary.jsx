@@ -12,9 +12,12 @@ export default function LiveCommentary({ matchId }) {
       setLines((prev) => [...prev, ...newLines]);
     };
 
+    // server sends "end" once commentary is complete
+    evtSource.addEventListener("end", () => evtSource.close());
+
     evtSource.onerror = () => {
-      console.error("SSE connection lost.");
-      evtSource.close();
+      // browser reconnects with Last-Event-ID and resumes where it left off
+      console.error("SSE connection lost, reconnecting...");
     };
 
     return () => evtSource.close();
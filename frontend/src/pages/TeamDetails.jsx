@@ -356,7 +356,7 @@ useEffect(() => {
 
             <div>
             <p className="text-3xl font-black text-yellow-300 drop-shadow-[0_0_10px_rgba(255,195,20,0.55)]">
-                {team.finalsHistory?.length ?? 0}
+                {team.finalsCount ?? 0}
             </p>
             <p className="text-blue-200/60 text-[11px] mt-1 uppercase font-semibold tracking-wide">
                 Finals Reached
@@ -365,7 +365,7 @@ useEffect(() => {
 
             <div>
             <p className="text-3xl font-black text-yellow-200 drop-shadow-[0_0_10px_rgba(255,215,100,0.55)]">
-                {team.winnersHistory?.length ?? 0}
+                {team.titlesCount ?? 0}
             </p>
             <p className="text-blue-200/60 text-[11px] mt-1 uppercase font-semibold tracking-wide">
                 Titles Won
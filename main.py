@@ -5,7 +5,7 @@ This single-file starter implements:
 - MongoDB (Motor) async connection
 - Pydantic models for User (Representative), Team, Player, Match, Tournament
 - Auto-generation of players (23) with ratings per rules
-- Team rating calculation (average of natural-position ratings)
+- Team rating calculation (best starting XI for the team formation)
 - Match simulation endpoint using Poisson goals + scorer assignment
 - Seed route to create 7 demo teams and a route to add an 8th
 - Admin endpoints: start tournament (builds quarter-final bracket) and reset
@@ -31,43 +31,101 @@ Endpoints summary (HTTP):
 - POST /teams                         -> create team (send JSON {country, managerName, representativeEmail})
 - POST /teams/{team_id}/autofill      -> autofill 23 players for that team
 - GET  /teams                         -> list teams
+- GET  /teams/{team_id}/lineup        -> best starting XI for the team's formation (?formation= to preview)
+- PUT  /teams/{team_id}/formation     -> change formation (4-4-2, 4-3-3, ...); XI and rating follow
+- GET  /teams/export                  -> admin bulk dump of teams + players as a columnar .npz
+- POST /teams/import                  -> admin bulk load of a .npz produced by /teams/export
+- POST /seed/load_test_players        -> admin bulk-generate synthetic squads for load testing
 - POST /tournament/start              -> admin route to start tournament if 8 teams registered
+- POST /admin/jobs/{wipe_teams,reseed,reset_tournament} -> admin background bulk jobs (?mode=batches|drop)
+- GET  /admin/jobs/{job_id}/events    -> SSE progress of a maintenance job (resumable)
 - POST /matches/{match_id}/simulate  -> simulate the match and return result
+- GET  /admin/index_audit            -> admin: explain() known query shapes, report collection scans
+- GET  /admin/cache                  -> admin: read-cache hit rate and invalidation feed (change stream / poll)
+- GET  /admin/calibrate              -> admin: fit match-model constants to stored results
+- POST /admin/calibrate/apply        -> admin: refit and switch the simulator to the fit
+- POST /admin/simulate_batch         -> admin: play ?tournaments= knockouts in memory, return aggregates
 - GET  /tournament/bracket            -> view bracket (basic)
+- GET  /matches/{match_id}/odds       -> pre-match odds + full scoreline distributions
+- GET  /matches/{match_id}/live       -> SSE replay of a played match at ?speed= (resumable)
+- GET  /seasons                       -> archived seasons (finished tournaments), newest first
 
 StartUp
 - uvicorn main:app --reload --port 8000
 - ./venv/Scripts/Activate
 
+Tests
+- pip install -r requirements-dev.txt
+- python -m pytest tests
+
 
 """
 
-from fastapi import FastAPI, HTTPException, Body, BackgroundTasks, Depends, status
+from fastapi import FastAPI, HTTPException, Body, BackgroundTasks, Depends, Header, Query, Request, status
 from fastapi.security import HTTPBasic, HTTPBasicCredentials, HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel, Field
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from bson import ObjectId
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings
 from pydantic.types import SecretStr
-from pymongo.errors import DuplicateKeyError
-from typing import List, Optional, Dict, Any
+from pymongo import ReturnDocument, UpdateOne, InsertOne, DeleteOne, DeleteMany, monitoring
+from pymongo.errors import DuplicateKeyError, BulkWriteError, OperationFailure
+from typing import List, Optional, Dict, Any, AsyncIterator, Tuple
+from dataclasses import dataclass, field
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+import abc
+import asyncio
+import functools
+import hashlib
+import hmac
+import time
 import random
 import secrets
+import tempfile
+import zipfile
 import numpy as np
+import orjson
 import uuid
 import jwt
 import httpx
 import json
 import os
+import re
+
+
+# --- Fast JSON responses ---
+# Mongo documents are plain dicts/lists/datetimes, which orjson encodes natively,
+# so hot endpoints return MongoJSONResponse directly and skip FastAPI's
+# jsonable_encoder walk over every nested value.
+def _json_default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+class MongoJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_json_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
 
+GZIP_MIN_BYTES = 1024  # smaller payloads aren't worth the compression CPU
 
-app = FastAPI(title="African Nations League - Backend Starter")
+app = FastAPI(title="African Nations League - Backend Starter", default_response_class=MongoJSONResponse)
 
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_BYTES, compresslevel=5)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -104,8 +162,357 @@ conf = ConnectionConfig(
 
 
 
+# --- Read cache + cross-worker invalidation ---
+# Public reads are cached per worker, tagged with what they were built from: a
+# collection ("teams") or one document ("teams:<id>"). Entries are dropped when a write
+# touches a tag, from three sources:
+#   - this worker's own writes, seen by a driver command listener (immediate);
+#   - other workers' writes, from a change stream on the database (replica set/mongos);
+#   - on a standalone mongod (no change streams), every worker bumps a per-collection
+#     epoch in db.cache_epochs after its writes, and the others poll it every
+#     CACHE_POLL_SECONDS. Writes made outside the app are only seen with change streams.
+# Until one of the cross-worker feeds is running (or while it reconnects) nothing is
+# cached. CACHE_SYNC=off disables caching, CACHE_SYNC=poll skips change streams.
+CACHE_SYNC = os.getenv("CACHE_SYNC", "auto")
+CACHE_POLL_SECONDS = float(os.getenv("CACHE_POLL_SECONDS", "1"))
+CACHE_RETRY_SECONDS = 5
+READ_CACHE_SIZE = int(os.getenv("READ_CACHE_SIZE", "2048"))
+CACHE_WATCHED = ("teams", "players", "matches", "tournaments", "settings")
+CACHE_MAX_TARGETED_IDS = 100  # bigger writes invalidate the whole collection
+# poll mode: one epoch per watched collection, plus one for team country/teamName changes
+CACHE_EPOCHS = CACHE_WATCHED + ("team_keys",)
+
+class ReadCache:
+    def __init__(self, size: int):
+        self.size = size
+        self.entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (value, tags)
+        self.by_tag: Dict[str, set] = {}
+        # bumped on each invalidation; a fill that saw an older epoch is not stored
+        self.epochs: Dict[str, int] = {}
+        # single-doc tags with a fill in flight -> how many. Only those need an epoch:
+        # anything cached under a tag is dropped outright, so theirs go with the fill.
+        self.filling: Dict[str, int] = {}
+        self.hits = self.misses = self.invalidations = 0
+
+    def get(self, key: tuple):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def stamp(self, tags: List[str]) -> tuple:
+        # "teams:<id>" is also stale once the whole of "teams" has been invalidated
+        return (self.epochs.get("*", 0),) + tuple(
+            (self.epochs.get(t, 0), self.epochs.get("*" + t.split(":", 1)[0], 0)) for t in tags
+        )
+
+    def begin_fill(self, tags: List[str]) -> tuple:
+        for t in tags:
+            if ":" in t:
+                self.filling[t] = self.filling.get(t, 0) + 1
+        return self.stamp(tags)
+
+    def end_fill(self, tags: List[str]):
+        for t in tags:
+            if ":" in t:
+                self.filling[t] -= 1
+                if not self.filling[t]:
+                    del self.filling[t]
+                    self.epochs.pop(t, None)
+
+    def put(self, key: tuple, value, tags: List[str], stamp: tuple):
+        if stamp != self.stamp(tags):
+            return
+        self.entries[key] = (value, tags)
+        for t in tags:
+            self.by_tag.setdefault(t, set()).add(key)
+        if len(self.entries) > self.size:
+            self.drop(next(iter(self.entries)))
+
+    def drop(self, key: tuple):
+        _, tags = self.entries.pop(key, (None, ()))
+        for t in tags:
+            keys = self.by_tag.get(t)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.by_tag[t]
+
+    def invalidate(self, coll: str, doc_id=None):
+        """Entries built from coll (doc_id=None: including every single-doc entry of it)."""
+        self.invalidations += 1
+        tags = [coll]
+        self.epochs[coll] = self.epochs.get(coll, 0) + 1
+        if doc_id is None:
+            self.epochs["*" + coll] = self.epochs.get("*" + coll, 0) + 1
+            tags += [t for t in self.by_tag if t.startswith(coll + ":")]
+        else:
+            tag = f"{coll}:{doc_id}"
+            if tag in self.filling:
+                self.epochs[tag] = self.epochs.get(tag, 0) + 1
+            tags.append(tag)
+        for t in tags:
+            for key in list(self.by_tag.get(t, ())):
+                self.drop(key)
+
+    def clear(self):
+        self.invalidations += 1
+        self.epochs["*"] = self.epochs.get("*", 0) + 1
+        self.entries.clear()
+        self.by_tag.clear()
+
+read_cache = ReadCache(READ_CACHE_SIZE)
+
+def written_ids(command_name: str, command: Dict[str, Any]) -> Optional[list]:
+    """_ids a write command touches, or None when it can't be narrowed down."""
+    if command_name == "insert":
+        ids = [d.get("_id") for d in command.get("documents", [])]
+        return ids if 0 < len(ids) <= CACHE_MAX_TARGETED_IDS and None not in ids else None
+    if command_name == "update":
+        filters = [u.get("q", {}) for u in command.get("updates", [])]
+    elif command_name == "delete":
+        filters = [d.get("q", {}) for d in command.get("deletes", [])]
+    elif command_name == "findAndModify":
+        filters = [command.get("query", {})]
+    else:
+        return None
+    ids = []
+    for f in filters:
+        _id = f.get("_id")
+        if isinstance(_id, dict) and set(_id) == {"$in"}:
+            ids.extend(_id["$in"])
+        elif _id is None or isinstance(_id, dict):
+            return None
+        else:
+            ids.append(_id)
+    return ids if 0 < len(ids) <= CACHE_MAX_TARGETED_IDS else None
+
+def touches_team_keys(command_name: str, command: Dict[str, Any]) -> bool:
+    """Whether a teams write can change a country or teamName (what team_keys holds)."""
+    if command_name == "update":
+        updates = [u.get("u") for u in command.get("updates", [])]
+    elif command_name == "findAndModify" and not command.get("remove"):
+        updates = [command.get("update")]
+    else:
+        return True  # insert / delete / drop
+    for u in updates:
+        if not isinstance(u, dict) or not any(op.startswith("$") for op in u):
+            return True  # pipeline or whole-document replacement
+        if any(f.split(".")[0] in TEAM_KEY_FIELDS for fields in u.values() if isinstance(fields, dict) for f in fields):
+            return True
+    return False
+
+class CacheWriteListener(monitoring.CommandListener):
+    """
+    Every write this process sends invalidates the local cache twice: as it goes out,
+    and again once it is applied (for a transaction, once it commits). A read that
+    ran in between can't leave a stale entry behind.
+    """
+    WRITE_COMMANDS = ("insert", "update", "delete", "findAndModify", "drop")
+    TRANSACTION_END = ("commitTransaction", "abortTransaction")
+
+    def __init__(self):
+        self.inflight: Dict[tuple, tuple] = {}      # (connection, request id) -> (kind, write or session)
+        self.transactions: Dict[bytes, list] = {}   # session id -> writes waiting for the commit
+
+    @staticmethod
+    def session(command: Dict[str, Any]) -> Optional[bytes]:
+        lsid = command.get("lsid")
+        return bytes(lsid["id"]) if lsid else None
+
+    def started(self, event):
+        request = (event.connection_id, event.request_id)
+        if event.command_name in self.TRANSACTION_END:
+            session = self.session(event.command)
+            if session in self.transactions:
+                self.inflight[request] = (event.command_name, session)
+            return
+        if event.command_name not in self.WRITE_COMMANDS or event.database_name != DB_NAME:
+            return
+        coll = event.command.get(event.command_name)
+        if coll not in CACHE_WATCHED:
+            return
+        write = (coll, written_ids(event.command_name, event.command),
+                 coll == "teams" and touches_team_keys(event.command_name, event.command))
+        self.notify(write)
+        if event.command.get("autocommit") is False:
+            self.transactions.setdefault(self.session(event.command), []).append(write)
+        else:
+            self.inflight[request] = ("write", write)
+
+    def succeeded(self, event):
+        kind, value = self.inflight.pop((event.connection_id, event.request_id), (None, None))
+        if kind == "write":
+            self.notify(value)
+        elif kind == "commitTransaction":
+            for write in self.transactions.pop(value, ()):
+                self.notify(write)
+        elif kind == "abortTransaction":
+            self.transactions.pop(value, None)
+
+    def failed(self, event):
+        # a failed write may still have been partly applied; a failed commit is retried
+        kind, value = self.inflight.pop((event.connection_id, event.request_id), (None, None))
+        if kind == "write":
+            self.notify(value)
+        elif kind == "abortTransaction":
+            self.transactions.pop(value, None)
+
+    @staticmethod
+    def notify(write: tuple):
+        loop = cache_sync.loop
+        if loop is not None and not loop.is_closed():
+            # driver callbacks may run on Motor's worker threads
+            loop.call_soon_threadsafe(cache_sync.local_write, *write)
+
+class CacheSync:
+    def __init__(self):
+        self.mode = "off"  # off | change_stream | poll
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.task: Optional[asyncio.Task] = None
+        self.epochs: Optional[Dict[str, int]] = None  # poll mode: last seen cache_epochs
+        self.dirty: set = set()
+        self.flushing: Optional[asyncio.Task] = None
+        self.changes = 0
+
+    def invalidate(self, coll: str, doc_ids: Optional[list] = None, keys_changed: bool = True):
+        """keys_changed: for teams, whether the write may have moved a country/teamName."""
+        self.changes += 1
+        if coll == "teams" and keys_changed:
+            team_keys.invalidate()
+        if coll == "settings" and (doc_ids is None or "match_model" in doc_ids):
+            asyncio.ensure_future(reload_match_model())
+        if doc_ids is None:
+            read_cache.invalidate(coll)
+        else:
+            for doc_id in doc_ids:
+                read_cache.invalidate(coll, doc_id)
+
+    def local_write(self, coll: str, doc_ids: Optional[list], keys_changed: bool = True):
+        self.invalidate(coll, doc_ids, keys_changed)
+        if self.mode == "poll":
+            self.dirty.add(coll)
+            if coll == "teams" and keys_changed:
+                self.dirty.add("team_keys")
+            if self.flushing is None or self.flushing.done():
+                self.flushing = asyncio.ensure_future(self.flush_epochs())
+
+    async def flush_epochs(self):
+        """Tell the other workers (poll mode) which collections this one has written."""
+        while self.dirty:
+            coll = self.dirty.pop()
+            doc = await db.cache_epochs.find_one_and_update(
+                {"_id": coll}, {"$inc": {"epoch": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+            )
+            # skip our own bump, unless someone else's is folded into it
+            if self.epochs is not None and self.epochs.get(coll, 0) + 1 == doc["epoch"]:
+                self.epochs[coll] = doc["epoch"]
+
+    def apply_change(self, change: Dict[str, Any]):
+        op = change["operationType"]
+        coll = change.get("ns", {}).get("coll")
+        if op == "update":
+            desc = change.get("updateDescription", {})
+            fields = list(desc.get("updatedFields", {})) + list(desc.get("removedFields", []))
+            self.invalidate(coll, [change["documentKey"]["_id"]],
+                            any(f.split(".")[0] in TEAM_KEY_FIELDS for f in fields))
+        elif op in ("insert", "replace", "delete"):
+            self.invalidate(coll, [change["documentKey"]["_id"]])
+        elif op in ("drop", "rename"):
+            self.invalidate(coll)
+        else:  # dropDatabase / invalidate
+            read_cache.clear()
+            team_keys.invalidate()
+
+    async def watch(self):
+        token, opened = None, False
+        while True:
+            try:
+                async with db.watch([{"$match": {"ns.coll": {"$in": list(CACHE_WATCHED)}}}],
+                                    resume_after=token) as stream:
+                    if token is None:
+                        read_cache.clear()  # whatever happened while nobody was watching
+                    opened, self.mode = True, "change_stream"
+                    async for change in stream:
+                        token = stream.resume_token
+                        self.apply_change(change)
+            except asyncio.CancelledError:
+                raise
+            except (OperationFailure, NotImplementedError) as e:
+                if not opened:
+                    print("Change streams unavailable, polling cache epochs instead:", e)
+                    return await self.poll()
+                token = None  # e.g. resume point fell off the oplog
+            except Exception as e:
+                print("Change stream interrupted:", e)
+            self.mode = "off"
+            read_cache.clear()
+            await asyncio.sleep(CACHE_RETRY_SECONDS)
+
+    async def poll(self):
+        self.mode = "poll"
+        while True:
+            try:
+                seen = {d["_id"]: d["epoch"] async for d in db.cache_epochs.find({"_id": {"$in": list(CACHE_EPOCHS)}})}
+                if self.epochs is not None:
+                    for coll in CACHE_EPOCHS:
+                        if seen.get(coll, 0) == self.epochs.get(coll, 0):
+                            continue
+                        if coll == "team_keys":
+                            team_keys.invalidate()
+                        else:
+                            self.invalidate(coll, keys_changed=False)
+                self.epochs = {coll: seen.get(coll, 0) for coll in CACHE_EPOCHS}
+                self.mode = "poll"
+            except Exception as e:
+                print("Cache epoch poll failed:", e)
+                self.mode = "off"
+                read_cache.clear()
+            await asyncio.sleep(CACHE_POLL_SECONDS)
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        if CACHE_SYNC != "off":
+            self.task = asyncio.create_task(self.poll() if CACHE_SYNC == "poll" else self.watch())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+        self.mode = "off"
+
+cache_sync = CacheSync()
+
+def cached(*tags: str):
+    """
+    Serve repeat calls from read_cache until a write touches one of tags
+    ("coll" or "coll:{arg}", formatted with the call's keyword arguments).
+    """
+    def decorate(handler):
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            if cache_sync.mode == "off":
+                return await handler(*args, **kwargs)
+            key = (handler.__name__, args, tuple(sorted(kwargs.items())))
+            entry = read_cache.get(key)
+            if entry is not None:
+                return unshare_result(entry[0])
+            call_tags = [t.format(**kwargs) for t in tags]
+            stamp = read_cache.begin_fill(call_tags)
+            try:
+                value = share_result(await handler(*args, **kwargs))
+                read_cache.put(key, value, call_tags, stamp)
+            finally:
+                read_cache.end_fill(call_tags)
+            return unshare_result(value)
+        return wrapper
+    return decorate
+
+
 # --- Database init ---
-client = AsyncIOMotorClient(MONGO_URI)
+client = AsyncIOMotorClient(MONGO_URI, event_listeners=[CacheWriteListener()])
 db = client[DB_NAME]
 
 
@@ -118,11 +525,41 @@ JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 JWT_EXP_MINUTES = int(os.getenv("JWT_EXP_MINUTES", "60"))
 
 ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "admin")
-ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin123")
+
+# Admin password is checked against a salted PBKDF2 hash: "pbkdf2_sha256$<iterations>$<salt hex>$<hash hex>".
+# Set ADMIN_PASSWORD_HASH in production; a plain ADMIN_PASSWORD is hashed once at startup for dev setups.
+PASSWORD_HASH_ITERATIONS = 200_000
+
+def hash_password(password: str, iterations: int = PASSWORD_HASH_ITERATIONS) -> str:
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${salt.hex()}${digest.hex()}"
+
+def verify_password(password: str, encoded: str) -> bool:
+    try:
+        scheme, iterations, salt, expected = encoded.split("$")
+    except ValueError:
+        return False
+    if scheme != "pbkdf2_sha256":
+        return False
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), bytes.fromhex(salt), int(iterations))
+    return hmac.compare_digest(digest.hex(), expected)
+
+ADMIN_PASSWORD_HASH = os.getenv("ADMIN_PASSWORD_HASH") or hash_password(os.getenv("ADMIN_PASSWORD", "admin123"))
+
+# Verified tokens are cached (keyed by sha256 of the token) so repeat admin calls skip the
+# HMAC check; entries still honour exp. Revoked token ids live in revoked_tokens (TTL'd at
+# exp) and are mirrored in memory, refreshed every REVOCATION_REFRESH_SECONDS.
+JWT_CACHE_SIZE = 1024
+REVOCATION_REFRESH_SECONDS = 30
+
+verified_tokens: "OrderedDict[str, dict]" = OrderedDict()
+revoked_token_ids: set = set()
+revocations_loaded_at = 0.0
 
 def create_jwt_token(subject: str) -> str:
     exp = datetime.utcnow() + timedelta(minutes=JWT_EXP_MINUTES)
-    payload = {"sub": subject, "exp": exp}
+    payload = {"sub": subject, "exp": exp, "jti": secrets.token_hex(16)}
     token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
     if isinstance(token, bytes):
         token = token.decode("utf-8")
@@ -136,10 +573,42 @@ def decode_jwt_token(token: str):
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+def token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def token_id(token: str, payload: dict) -> str:
+    # tokens issued before jti existed are revoked by their hash
+    return payload.get("jti") or token_key(token)
+
+def verify_jwt_cached(token: str) -> dict:
+    key = token_key(token)
+    payload = verified_tokens.get(key)
+    if payload is None:
+        payload = decode_jwt_token(token)
+        verified_tokens[key] = payload
+        if len(verified_tokens) > JWT_CACHE_SIZE:
+            verified_tokens.popitem(last=False)
+    else:
+        verified_tokens.move_to_end(key)
+        # exp is epoch seconds; compare against time.time(), not a naive utcnow
+        if payload["exp"] <= time.time():
+            verified_tokens.pop(key, None)
+            raise HTTPException(status_code=401, detail="Token expired")
+    return payload
+
+async def refresh_revocations(force: bool = False):
+    global revoked_token_ids, revocations_loaded_at
+    loop_time = asyncio.get_running_loop().time()
+    if not force and loop_time - revocations_loaded_at < REVOCATION_REFRESH_SECONDS:
+        return
+    revocations_loaded_at = loop_time
+    revoked_token_ids = {d["_id"] async for d in db.revoked_tokens.find({}, {"_id": 1})}
+
 @app.post("/admin/login")
-def admin_login(credentials: HTTPBasicCredentials = Depends(security_basic)):
+async def admin_login(credentials: HTTPBasicCredentials = Depends(security_basic)):
     username_ok = secrets.compare_digest(credentials.username, ADMIN_USERNAME)
-    password_ok = secrets.compare_digest(credentials.password, ADMIN_PASSWORD)
+    # PBKDF2 is deliberately slow; keep it off the event loop
+    password_ok = await asyncio.to_thread(verify_password, credentials.password, ADMIN_PASSWORD_HASH)
     if not (username_ok and password_ok):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -152,33 +621,327 @@ def admin_login(credentials: HTTPBasicCredentials = Depends(security_basic)):
 # Dependency for admin-only endpoints
 async def admin_required(creds: HTTPAuthorizationCredentials = Depends(security_bearer)):
     token = creds.credentials
-    payload = decode_jwt_token(token)
+    payload = verify_jwt_cached(token)
+    await refresh_revocations()
+    if token_id(token, payload) in revoked_token_ids:
+        raise HTTPException(status_code=401, detail="Token revoked")
     if payload.get("sub") != ADMIN_USERNAME:
         raise HTTPException(status_code=403, detail="Forbidden")
     return payload
 
+@app.post("/admin/logout")
+async def admin_logout(creds: HTTPAuthorizationCredentials = Depends(security_bearer)):
+    """Revoke the presented token on every worker (within REVOCATION_REFRESH_SECONDS)."""
+    token = creds.credentials
+    payload = verify_jwt_cached(token)
+    jti = token_id(token, payload)
+    await db.revoked_tokens.update_one(
+        {"_id": jti},
+        {"$set": {"exp": datetime.utcfromtimestamp(payload["exp"])}},
+        upsert=True
+    )
+    revoked_token_ids.add(jti)
+    verified_tokens.pop(token_key(token), None)
+    return {"message": "Token revoked"}
+
+
+# --- Index manager ---
+# Indexes are declared next to the query shapes they serve. With INDEX_AUDIT=true
+# startup also explain()s every shape and reports collection scans; the same report
+# is available on demand from GET /admin/index_audit.
+INDEX_AUDIT = os.getenv("INDEX_AUDIT", "False").lower() == "true"
+
+# superseded by a compound index with the same prefix
+OBSOLETE_INDEXES = [("matches", "round_1"), ("matches", "tournamentId_1"), ("tournaments", "status_1")]
+
+def declared_indexes() -> List[tuple]:
+    """(collection, keys, options) for every index the app relies on."""
+    return [
+        ("players", "teamId", {}),
+        ("players", "name", {}),
+        ("teams", "country", {"unique": True}),
+        ("teams", "teamName", {"unique": True}),
+        # round listings / "what's left to play in this round"
+        ("matches", [("tournamentId", 1), ("round", 1), ("status", 1)], {}),
+        # one match per bracket slot (legacy matches have no slot)
+        ("matches", [("tournamentId", 1), ("round", 1), ("slot", 1)],
+         {"unique": True, "partialFilterExpression": {"slot": {"$exists": True}}}),
+        ("matches", "status", {}),
+        ("tournaments", "active", {"unique": True, "sparse": True}),
+        ("tournaments", [("status", 1), ("createdAt", -1)], {}),
+        ("tournaments", "createdAt", {}),
+        ("team_history", [("teamId", 1), ("date", -1)], {}),
+        ("season_archive", "season", {"unique": True}),
+        ("season_archive", "winner", {}),
+        ("idempotency_keys", "createdAt", {"expireAfterSeconds": IDEMPOTENCY_KEY_TTL}),
+        ("revoked_tokens", "exp", {"expireAfterSeconds": 0}),
+        ("rate_limits", "expireAt", {"expireAfterSeconds": 0}),
+    ]
+
+# (label, collection, filter, sort) for the queries the app actually runs
+QUERY_SHAPES = [
+    ("round matches", "matches", {"tournamentId": "t", "round": "QuarterFinal"}, [("slot", 1)]),
+    ("unplayed round matches", "matches", {"tournamentId": "t", "round": "QuarterFinal", "status": {"$ne": "simulated"}}, None),
+    ("tournament matches", "matches", {"tournamentId": "t"}, None),
+    ("simulated matches", "matches", {"status": "simulated"}, None),
+    ("latest tournament", "tournaments", {}, [("createdAt", -1)]),
+    ("current tournament", "tournaments", {"status": {"$in": ["in_progress", "finished"]}}, [("createdAt", -1)]),
+    ("finished tournaments", "tournaments", {"status": "finished"}, [("createdAt", 1)]),
+    ("team squad", "players", {"teamId": "t"}, None),
+    ("team history", "team_history", {"teamId": "t"}, [("date", -1)]),
+]
+
+async def backfill_active_tournament():
+    """
+    Tournaments started before the unique "active" flag existed would not block a
+    second start: flag the newest in-progress one if none is flagged.
+    """
+    if await db.tournaments.find_one({"active": True}, {"_id": 1}):
+        return
+    legacy = await db.tournaments.find_one({"status": "in_progress"}, {"_id": 1}, sort=[("createdAt", -1)])
+    if legacy:
+        try:
+            await db.tournaments.update_one({"_id": legacy["_id"], "status": "in_progress"},
+                                            {"$set": {"active": True}})
+        except DuplicateKeyError:
+            pass  # a new tournament got flagged meanwhile
+
+async def ensure_indexes(collections=None):
+    if collections is None or "tournaments" in collections:
+        await backfill_active_tournament()
+    for coll, name in OBSOLETE_INDEXES:
+        if collections is not None and coll not in collections:
+            continue
+        try:
+            await db[coll].drop_index(name)
+        except OperationFailure:
+            pass  # not there (never created, or another worker dropped it first)
+    for coll, keys, options in declared_indexes():
+        if collections is not None and coll not in collections:
+            continue
+        try:
+            await db[coll].create_index(keys, **options)
+        except Exception as e:
+            # e.g. existing data violating a new unique index: report it, keep starting up
+            print(f"Index {coll} {keys} not created:", e)
+
+def plan_stages(plan: dict) -> List[dict]:
+    stages = [plan]
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            stages.extend(plan_stages(child))
+    return stages
+
+async def audit_query_plans() -> List[Dict[str, Any]]:
+    report = []
+    for label, coll, flt, sort in QUERY_SHAPES:
+        entry = {"query": label, "collection": coll, "filter": flt}
+        cursor = db[coll].find(flt)
+        if sort:
+            cursor = cursor.sort(sort)
+        try:
+            explained = await cursor.explain()
+            stages = plan_stages(explained["queryPlanner"]["winningPlan"])
+            entry["stages"] = [st["stage"] for st in stages]
+            entry["indexes"] = [st["indexName"] for st in stages if "indexName" in st]
+            entry["collectionScan"] = "COLLSCAN" in entry["stages"]
+        except Exception as e:
+            entry["error"] = str(e)
+        report.append(entry)
+    return report
+
+@app.get("/admin/index_audit")
+async def index_audit(admin=Depends(admin_required)):
+    """explain() every known query shape; lists the ones that fall back to a collection scan."""
+    report = await audit_query_plans()
+    return {
+        "collectionScans": [r["query"] for r in report if r.get("collectionScan")],
+        "queries": report,
+    }
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    cache_sync.stop()
+    if sim_pool is not None:
+        sim_pool.shutdown(wait=False, cancel_futures=True)
+
 
 @app.on_event("startup")
 async def startup_event():
     try:
         await client.admin.command("ping")
         print("MongoDB connected:", db.name)
-        # indexes
-        await db.players.create_index("teamId")
-        await db.players.create_index("name")
-        await db.teams.create_index("country", unique=True)
-        await db.teams.create_index("teamName", unique=True)
-        await db.matches.create_index("round")
-        await db.matches.create_index("tournamentId")
-        await db.tournaments.create_index("status")
+        await ensure_indexes()
+        await team_keys.warm()
+        await supports_transactions()
+        if INDEX_AUDIT:
+            for entry in await audit_query_plans():
+                if entry.get("collectionScan"):
+                    print(f"Index audit: {entry['query']} ({entry['collection']}): COLLSCAN")
+        # calibrated match-model parameters, if an admin has applied any
+        await reload_match_model()
+        cache_sync.start()
     except Exception as e:
         print("MongoDB connection failed:", e)
 
 
+async def reload_match_model():
+    doc = await db.settings.find_one({"_id": "match_model"})
+    if doc:
+        set_match_model(MatchModel.from_doc(doc))
+
+
+@app.get("/admin/cache")
+async def cache_stats(admin=Depends(admin_required)):
+    lookups = read_cache.hits + read_cache.misses
+    return {
+        "mode": cache_sync.mode,
+        "entries": len(read_cache.entries),
+        "hits": read_cache.hits,
+        "misses": read_cache.misses,
+        "hitRate": round(read_cache.hits / lookups, 4) if lookups else None,
+        "invalidations": read_cache.invalidations,
+        "changesSeen": cache_sync.changes,
+    }
+
+
+# --- Public read protection: per-client rate limiting + request coalescing ---
+# Token bucket per client IP: RATE_LIMIT_BURST requests at once, refilled at
+# RATE_LIMIT_PER_SECOND. Buckets live in process memory by default; with
+# RATE_LIMIT_BACKEND=mongo they are shared by all workers through db.rate_limits.
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "5"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "20"))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "False").lower() == "true"
+# Number of reverse proxies in front of the app. Each appends the address it saw
+# to X-Forwarded-For, so the client is that many hops from the right; anything
+# further left was sent by the client and can't be trusted.
+RATE_LIMIT_TRUSTED_PROXIES = max(1, int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "1")))
+RATE_LIMIT_MAX_CLIENTS = 50_000
+
+class MemoryBuckets:
+    def __init__(self, rate: float, burst: float):
+        self.rate, self.burst = rate, burst
+        self.buckets: Dict[str, List[float]] = {}  # client -> [tokens, last refill]
+
+    async def take(self, client_key: str) -> float:
+        """Spend a token; returns 0 if allowed, else seconds until one is available."""
+        now = time.monotonic()
+        if len(self.buckets) > RATE_LIMIT_MAX_CLIENTS:
+            self.prune(now)
+        bucket = self.buckets.setdefault(client_key, [self.burst, now])
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / self.rate
+
+    def prune(self, now: float):
+        # a bucket that has refilled completely carries no state worth keeping
+        full_after = self.burst / self.rate
+        self.buckets = {k: b for k, b in self.buckets.items() if now - b[1] < full_after}
+
+class MongoBuckets:
+    """Same bucket, updated atomically server-side with a pipeline update."""
+    def __init__(self, rate: float, burst: float):
+        self.rate, self.burst = rate, burst
+
+    async def take(self, client_key: str) -> float:
+        now = time.time()
+        refilled = {"$min": [self.burst, {"$add": [
+            {"$ifNull": ["$tokens", self.burst]},
+            {"$multiply": [{"$subtract": [now, {"$ifNull": ["$ts", now]}]}, self.rate]}
+        ]}]}
+        doc = await db.rate_limits.find_one_and_update(
+            {"_id": client_key},
+            [
+                {"$set": {"tokens": refilled, "ts": now,
+                          "expireAt": datetime.utcnow() + timedelta(seconds=self.burst / self.rate)}},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]},
+                          "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]}}},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return 0.0 if doc["allowed"] else (1 - doc["tokens"]) / self.rate
+
+rate_buckets = (MongoBuckets if RATE_LIMIT_BACKEND == "mongo" else MemoryBuckets)(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST)
+
+def client_key(request: Request) -> str:
+    forwarded = request.headers.get("x-forwarded-for")
+    if RATE_LIMIT_TRUST_PROXY and forwarded:
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        if len(hops) >= RATE_LIMIT_TRUSTED_PROXIES:
+            return hops[-RATE_LIMIT_TRUSTED_PROXIES]
+    return request.client.host if request.client else "unknown"
+
+async def public_rate_limit(request: Request):
+    wait = await rate_buckets.take(client_key(request))
+    if wait > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={"Retry-After": str(max(1, int(wait + 0.999)))},
+        )
+
+inflight_reads: Dict[tuple, asyncio.Future] = {}
+
+@dataclass(slots=True, frozen=True)
+class RenderedResponse:
+    """What of a handler's Response is safe to hand to several requests."""
+    body: bytes
+    status_code: int
+    media_type: Optional[str]
+
+def share_result(value):
+    # middleware (gzip, CORS) rewrites a Response's headers in place, so a Response
+    # is shared as its rendered parts and rebuilt per request by unshare_result
+    if isinstance(value, Response):
+        return RenderedResponse(value.body, value.status_code, value.media_type)
+    return value
+
+def unshare_result(value):
+    if isinstance(value, RenderedResponse):
+        return Response(content=value.body, status_code=value.status_code, media_type=value.media_type)
+    return value
+
+async def shared_call(handler, *args, **kwargs):
+    return share_result(await handler(*args, **kwargs))
+
+def coalesced(handler):
+    """
+    Identical concurrent calls (same handler, same arguments) share one in-flight
+    computation and all get its result. Nothing is cached once it completes.
+    """
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        key = (handler.__name__, args, tuple(sorted(kwargs.items())))
+        task = inflight_reads.get(key)
+        if task is None:
+            task = asyncio.ensure_future(shared_call(handler, *args, **kwargs))
+            inflight_reads[key] = task
+            task.add_done_callback(lambda _: inflight_reads.pop(key, None))
+        return unshare_result(await asyncio.shield(task))
+    return wrapper
+
 
 # --- Helper constants ---
 POSITIONS = ["GK", "DF", "MD", "AT"]
 
+# starting XI shapes: players per position, in POSITIONS order (always 1 GK + 10)
+FORMATIONS = {
+    "4-4-2": (1, 4, 4, 2),
+    "4-3-3": (1, 4, 3, 3),
+    "4-5-1": (1, 4, 5, 1),
+    "3-5-2": (1, 3, 5, 2),
+    "3-4-3": (1, 3, 4, 3),
+    "5-3-2": (1, 5, 3, 2),
+    "5-4-1": (1, 5, 4, 1),
+}
+DEFAULT_FORMATION = "4-4-2"
+
 # Random names for autofill
 FIRST_NAMES = [
     "Mohamed", "Samuel", "John", "Pierre", "Amin", "Ibrahim", "Daniel", "Kwame",
@@ -202,101 +965,207 @@ AFRICAN_COUNTRIES = [
 ]
 
 
-# --- Pydantic models ---
-class PlayerInDB(BaseModel):
-    name: str
-    naturalPosition: str
-    ratings: Dict[str, int]
-    isCaptain: bool = False
-    imageUrl: Optional[str] = None 
-    teamId: Optional[str] = None  # <-- default to None
-
-
-class TeamInDB(BaseModel):
+# --- Internal document structs ---
+# Plain slotted dataclasses for data we build ourselves: no per-document validation,
+# and to_doc() converts straight to the BSON dicts Motor uses.
+# Pydantic models below are only for request payloads.
+@dataclass(slots=True)
+class TeamInDB:
     country: str
     teamName: str
     managerName: str
     representativeEmail: str
-    squad: List[str] = []  # list of player _id strings
+    squad: List[str] = field(default_factory=list)  # list of player _id strings
     rating: float = 0.0
-    createdAt: datetime = Field(default_factory=datetime.utcnow)
+    createdAt: datetime = field(default_factory=datetime.utcnow)
     wins: int = 0
     losses: int = 0
-    finalsHistory: List[Dict[str, Any]] = []     # finalists appearances (winner & runner-up)
-    winnersHistory: List[Dict[str, Any]] = []    # tournament titles
-
-class GoalEvent(BaseModel):
-    minute: int
-    teamId: str
-    playerId: str
+    finalsCount: int = 0     # finals reached; entries live in the team_history collection
+    titlesCount: int = 0     # tournament titles
+    formation: str = DEFAULT_FORMATION
+    id: str = field(default_factory=lambda: make_id("team"))
+
+    def to_doc(self) -> Dict[str, Any]:
+        return {
+            "_id": self.id,
+            "country": self.country,
+            "teamName": self.teamName,
+            "managerName": self.managerName,
+            "representativeEmail": self.representativeEmail,
+            "squad": self.squad,
+            "rating": self.rating,
+            "createdAt": self.createdAt,
+            "wins": self.wins,
+            "losses": self.losses,
+            "finalsCount": self.finalsCount,
+            "titlesCount": self.titlesCount,
+            "formation": self.formation
+        }
 
-class MatchInDB(BaseModel):
+@dataclass(slots=True)
+class MatchInDB:
     round: str
     homeTeam: str
     awayTeam: str
-    status: str = "pending"  # pending | simulated
-    score: Dict[str, int] = Field(default_factory=lambda: {"home": 0, "away": 0})
-    goalEvents: List[GoalEvent] = []
+    tournamentId: Optional[str] = None
+    slot: int = 0            # position within the round; unique per (tournamentId, round)
+    status: str = "pending"  # pending | simulating | simulated
+    score: Dict[str, int] = field(default_factory=lambda: {"home": 0, "away": 0})
+    goalEvents: List[Dict[str, Any]] = field(default_factory=list)  # {minute, teamId, playerId}
     winner: Optional[str] = None
-    commentary: List[str] = Field(default_factory=list)
+    commentary: List[str] = field(default_factory=list)
     playedAt: Optional[datetime] = None
+    id: str = field(default_factory=lambda: make_id("match"))
+
+    def to_doc(self) -> Dict[str, Any]:
+        return {
+            "_id": self.id,
+            "round": self.round,
+            "homeTeam": self.homeTeam,
+            "awayTeam": self.awayTeam,
+            "tournamentId": self.tournamentId,
+            "slot": self.slot,
+            "status": self.status,
+            "score": self.score,
+            "goalEvents": self.goalEvents,
+            "winner": self.winner,
+            "commentary": self.commentary,
+            "playedAt": self.playedAt
+        }
+
+def pair_round_matches(tournament_id: str, round_name: str, team_ids: List[str]) -> List[Dict[str, Any]]:
+    """Match docs pairing team_ids (0v1, 2v3, ...) for one round; an odd last team is left out."""
+    return [
+        MatchInDB(round=round_name, homeTeam=team_ids[i], awayTeam=team_ids[i + 1],
+                  tournamentId=tournament_id, slot=i // 2).to_doc()
+        for i in range(0, len(team_ids) - 1, 2)
+    ]
 
+# --- Pydantic models (HTTP payloads) ---
 class CreateTeamPayload(BaseModel):
     country: str
     teamName: str
     managerName: str
     representativeEmail: str
 
+class FormationPayload(BaseModel):
+    formation: str
+
 class ReplaceTeamPayload(BaseModel):
     remove_team_id: str
     country: str
     teamName: str
     managerName: str
     representativeEmail: str
+    autofill: bool = False  # generate the new team's 23-man squad in the same swap
 
-# --- Utility functions ---
-def rand_name():
-    return f"{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)}"
+# --- Team rating: best starting XI for the team's formation ---
+# A team's rating is the mean rating of its optimal starting XI, each player rated at
+# the position they are picked for. Picking the XI is an assignment problem (11 formation
+# slots x squad players, cost = -rating at the slot's position), solved exactly with
+# the Hungarian algorithm. The result is cached on the team doc ("lineup") and
+# recomputed whenever the squad changes.
 
-# --- Utility: compute team rating efficiently ---
-async def compute_team_rating(team_id: str) -> float:
-    team = await db.teams.find_one({"_id": team_id})
-    if not team or not team.get("squad"):
-        return 0.0
-    players = await db.players.find({"_id": {"$in": team["squad"]}}).to_list(length=None)
-    ratings = []
-    for p in players:
-        pos = p.get("naturalPosition")
-        r = p.get("ratings", {}).get(pos)
-        if pos and r is not None:
-            ratings.append(r)
-    return float(sum(ratings)/len(ratings)) if ratings else 0.0
-
-
-
-async def insert_player(player: PlayerInDB) -> str:
-    doc = player.dict()
-    res = await db.players.insert_one(doc)
-    return str(res.inserted_id)
-
-
-# --- Player auto-generation abiding by rating rules ---
-def generate_player(natural_pos: Optional[str] = None, make_captain=False) -> PlayerInDB:
-    if natural_pos is None:
-        natural_pos = random.choices(POSITIONS, weights=[2, 7, 8, 6], k=1)[0]
-    ratings = {}
-    for pos in POSITIONS:
-        if pos == natural_pos:
-            ratings[pos] = random.randint(50, 100)
-        else:
-            ratings[pos] = random.randint(0, 50)
-    return PlayerInDB(
-    name=rand_name(),
-    naturalPosition=natural_pos,
-    ratings=ratings,
-    isCaptain=make_captain,
-    imageUrl=None  # default
+def solve_assignment(cost: np.ndarray) -> np.ndarray:
+    """
+    Minimum-cost assignment of every row to a distinct column (rows <= columns).
+    Hungarian algorithm, O(rows^2 * cols), inner updates vectorised over columns.
+    Returns the column chosen for each row.
+    """
+    n, m = cost.shape
+    u, v = np.zeros(n + 1), np.zeros(m + 1)
+    match = np.zeros(m + 1, dtype=np.int64)  # match[j] = row (1-based) holding column j; column 0 is a sentinel
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        match[0], j0 = i, 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            reduced = cost[match[j0] - 1] - u[match[j0]] - v[1:]
+            free = ~used[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            u[match[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if match[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+    cols = np.empty(n, dtype=np.int64)
+    assigned = np.flatnonzero(match[1:]) + 1
+    cols[match[assigned] - 1] = assigned - 1
+    return cols
+
+def formation_slots(formation: str) -> np.ndarray:
+    """Position index (into POSITIONS) of each of the 11 slots."""
+    return np.repeat(np.arange(len(POSITIONS)), FORMATIONS[formation])
+
+def best_lineup(ratings: np.ndarray, formation: str = DEFAULT_FORMATION):
+    """
+    ratings: (n_players, 4) in POSITIONS order. Returns (player row per slot, slot
+    positions, lineup rating). Short squads leave slots empty (-1), rated 0.
+    """
+    slots = formation_slots(formation)
+    ratings = np.asarray(ratings, dtype=float).reshape(-1, len(POSITIONS))
+    n = ratings.shape[0]
+    if n < slots.size:  # pad with zero-rated dummies
+        ratings = np.vstack([ratings, np.zeros((slots.size - n, len(POSITIONS)))])
+    cost = -ratings[:, slots].T                      # (11, players)
+    rows = solve_assignment(cost)
+    rating = float(ratings[rows, slots].sum() / slots.size)
+    rows = np.where(rows < n, rows, -1)
+    return rows, slots, rating
+
+def lineup_ratings(ratings: np.ndarray, squad_sizes: np.ndarray, formations: Optional[List[str]] = None) -> np.ndarray:
+    """
+    Best-XI rating for consecutive squads packed in one (N, 4) ratings matrix,
+    each in its own formation (default: DEFAULT_FORMATION for all).
+    """
+    bounds = np.concatenate([[0], np.cumsum(squad_sizes)])
+    formations = formations or [DEFAULT_FORMATION] * len(squad_sizes)
+    return np.array([best_lineup(ratings[a:b], f)[2] if b > a else 0.0
+                     for a, b, f in zip(bounds[:-1], bounds[1:], formations)])
+
+def build_lineup(players: List[Dict[str, Any]], formation: str = DEFAULT_FORMATION) -> dict:
+    """Best XI of the given player docs (need _id, name, ratings) as a lineup dict."""
+    ratings = np.array([[p.get("ratings", {}).get(pos, 0) for pos in POSITIONS] for p in players], dtype=float)
+    rows, slots, rating = best_lineup(ratings, formation)
+    return {
+        "formation": formation,
+        "rating": rating,
+        "players": [
+            {"playerId": players[r]["_id"], "name": players[r].get("name"), "position": POSITIONS[pos],
+             "rating": int(ratings[r, pos])}
+            for r, pos in zip(rows, slots) if r >= 0
+        ],
+    }
+
+async def refresh_team_lineup(team_id: str, formation: Optional[str] = None) -> Optional[dict]:
+    """Recompute the team's best XI (and so its rating) and cache both on the team doc."""
+    team = await db.teams.find_one({"_id": team_id}, {"squad": 1, "formation": 1})
+    if not team:
+        return None
+    formation = formation or team.get("formation", DEFAULT_FORMATION)
+    players = await db.players.find(
+        {"_id": {"$in": team.get("squad", [])}}, {"name": 1, "ratings": 1}
+    ).to_list(length=None)
+    lineup = build_lineup(players, formation)
+    rating = lineup["rating"]
+    await db.teams.update_one(
+        {"_id": team_id},
+        {"$set": {"formation": formation, "lineup": lineup, "rating": rating}}
     )
+    return lineup
+
 
 # --- Unique ID helpers ---
 def make_id(prefix: str) -> str:
@@ -304,6 +1173,149 @@ def make_id(prefix: str) -> str:
     # secrets.token_hex(8) gives 16 random hex chars (8 bytes = 64 bits of entropy)
     return f"{prefix}_{secrets.token_hex(8)}"
 
+def make_ids(prefix: str, n: int) -> np.ndarray:
+    """Vectorised make_id: n ids of the same shape, guaranteed distinct within the batch."""
+    hexes = np.empty(n, dtype="<U16")
+    todo = np.arange(n)
+    while todo.size:
+        raw = secrets.token_hex(8 * todo.size)
+        hexes[todo] = [raw[i:i + 16] for i in range(0, len(raw), 16)]
+        _, first = np.unique(hexes, return_index=True)
+        dup = np.ones(n, dtype=bool)
+        dup[first] = False
+        todo = np.flatnonzero(dup)
+    return np.char.add(f"{prefix}_", hexes)
+
+# --- Vectorised squad generation (same rules as autofill_team, K squads per call) ---
+SQUAD_SIZE = 23
+SQUAD_GOALKEEPERS = 2
+OUTFIELD_WEIGHTS = np.array([0, 7, 8, 6]) / 21  # weights for the remaining 21 slots
+
+def generate_squads(num_teams: int, team_ids=None, rng: Optional[np.random.Generator] = None) -> Dict[str, np.ndarray]:
+    """
+    Generate num_teams full squads in one NumPy pass.
+    Returns player columns in the /teams/export layout; team ratings (best XI) are
+    left to refresh_team_lineup / lineup_ratings.
+    """
+    rng = rng or np.random.default_rng()
+    n = num_teams * SQUAD_SIZE
+
+    # 2 guaranteed GKs + 21 weighted outfield draws, shuffled within each squad
+    pos = np.zeros((num_teams, SQUAD_SIZE), dtype=np.int64)
+    pos[:, SQUAD_GOALKEEPERS:] = rng.choice(
+        len(POSITIONS), size=(num_teams, SQUAD_SIZE - SQUAD_GOALKEEPERS), p=OUTFIELD_WEIGHTS
+    )
+    pos = rng.permuted(pos, axis=1).ravel()
+
+    # natural position 50-100, every other position 0-50
+    ratings = rng.integers(0, 51, size=(n, len(POSITIONS)), dtype=np.uint8)
+    natural = rng.integers(50, 101, size=n, dtype=np.uint8)
+    ratings[np.arange(n), pos] = natural
+
+    captains = np.zeros((num_teams, SQUAD_SIZE), dtype=bool)
+    captains[np.arange(num_teams), rng.integers(0, SQUAD_SIZE, size=num_teams)] = True
+
+    first = np.array(FIRST_NAMES)[rng.integers(0, len(FIRST_NAMES), size=n)]
+    last = np.array(LAST_NAMES)[rng.integers(0, len(LAST_NAMES), size=n)]
+
+    if team_ids is None:
+        team_ids = make_ids("team", num_teams)
+    return {
+        "player_id": make_ids("pl", n),
+        "player_teamId": np.repeat(np.asarray(team_ids, dtype=str), SQUAD_SIZE),
+        "player_name": np.char.add(np.char.add(first, " "), last),
+        "player_naturalPosition": np.array(POSITIONS)[pos],
+        "player_ratings": ratings,
+        "player_isCaptain": captains.ravel(),
+    }
+
+def player_docs(cols: Dict[str, np.ndarray], rows) -> List[Dict[str, Any]]:
+    """Turn player columns (export layout) into player documents for the given row indices."""
+    ids, team_ids = cols["player_id"], cols["player_teamId"]
+    names, natural = cols["player_name"], cols["player_naturalPosition"]
+    ratings = cols["player_ratings"]
+    captains = cols.get("player_isCaptain")
+    images = cols.get("player_imageUrl")
+    docs = []
+    for i in rows:
+        docs.append({
+            "_id": str(ids[i]),
+            "name": str(names[i]),
+            "naturalPosition": str(natural[i]),
+            "ratings": dict(zip(POSITIONS, ratings[i].tolist())),
+            "isCaptain": bool(captains[i]) if captains is not None else False,
+            "imageUrl": (str(images[i]) or None) if images is not None else None,
+            "teamId": str(team_ids[i])
+        })
+    return docs
+
+# --- Taken countries / team names ---
+# In-process mirror of the teams' unique keys (country, teamName -> team id), so
+# availability reads never touch the database. It is a read model only: uniqueness
+# is enforced by the unique indexes, and writes simply try and map DuplicateKeyError.
+# Writes on this worker update it directly; other workers' writes show up when it is
+# re-warmed (every TEAM_KEYS_TTL seconds, or right after a duplicate-key surprise).
+TEAM_KEYS_TTL = float(os.getenv("TEAM_KEYS_TTL", "30"))
+TEAM_KEY_FIELDS = ("country", "teamName")
+DUPLICATE_TEAM_DETAIL = {
+    "country": "A team for this country already exists.",
+    "teamName": "A team with this name already exists.",
+}
+
+class TeamKeys:
+    def __init__(self):
+        self.owners: Dict[str, Dict[str, str]] = {f: {} for f in TEAM_KEY_FIELDS}
+        self.loaded_at = 0.0
+        self.lock = asyncio.Lock()
+
+    async def warm(self):
+        owners = {f: {} for f in TEAM_KEY_FIELDS}
+        async for t in db.teams.find({}, {f: 1 for f in TEAM_KEY_FIELDS}):
+            for f in TEAM_KEY_FIELDS:
+                if t.get(f) is not None:
+                    owners[f][t[f]] = t["_id"]
+        self.owners, self.loaded_at = owners, time.monotonic()
+
+    async def fresh(self) -> "TeamKeys":
+        if time.monotonic() - self.loaded_at > TEAM_KEYS_TTL:
+            async with self.lock:
+                if time.monotonic() - self.loaded_at > TEAM_KEYS_TTL:
+                    await self.warm()
+        return self
+
+    def taken(self, field: str) -> List[str]:
+        return list(self.owners[field])
+
+    def add(self, doc: Dict[str, Any]):
+        for f in TEAM_KEY_FIELDS:
+            if doc.get(f) is not None:
+                self.owners[f][doc[f]] = doc["_id"]
+
+    def discard(self, doc: Dict[str, Any]):
+        for f in TEAM_KEY_FIELDS:
+            if self.owners[f].get(doc.get(f)) == doc["_id"]:
+                del self.owners[f][doc[f]]
+
+    def clear(self):
+        self.owners = {f: {} for f in TEAM_KEY_FIELDS}
+        self.loaded_at = time.monotonic()
+
+    def invalidate(self):
+        self.loaded_at = 0.0
+
+team_keys = TeamKeys()
+
+def duplicate_team_field(e: DuplicateKeyError) -> str:
+    """Which unique team key a DuplicateKeyError tripped on (country or teamName)."""
+    pattern = (e.details or {}).get("keyPattern") or {}
+    return next((f for f in TEAM_KEY_FIELDS if f in pattern),
+                "country" if "country" in str(e) else "teamName")
+
+def duplicate_team_error(e: DuplicateKeyError) -> HTTPException:
+    # another worker got there first; our copy of the keys is behind
+    team_keys.invalidate()
+    return HTTPException(status_code=400, detail=DUPLICATE_TEAM_DETAIL[duplicate_team_field(e)])
+
 # --- Team creation endpoint ---
 @app.post("/teams")
 async def create_team(payload: CreateTeamPayload):
@@ -311,26 +1323,19 @@ async def create_team(payload: CreateTeamPayload):
     if payload.country not in AFRICAN_COUNTRIES:
         raise HTTPException(status_code=400, detail="Invalid country. Must be one of the predefined African countries.")
 
-    # ensure country not already taken
-    existing = await db.teams.find_one({"country": payload.country})
-    if existing:
-        raise HTTPException(status_code=400, detail="A team for this country already exists.")
-    
-    # check team name uniqueness
-    existing_name = await db.teams.find_one({"teamName": payload.teamName})
-    if existing_name:
-        raise HTTPException(status_code=400, detail="A team with this name already exists.")
-    
-    # create team
+    # create team; the unique country/teamName indexes reject duplicates
     team = TeamInDB(
         country=payload.country,
         teamName=payload.teamName,
         managerName=payload.managerName,
         representativeEmail=payload.representativeEmail
     )
-    tdoc = team.dict()
-    tdoc["_id"] = make_id("team")
-    await db.teams.insert_one(tdoc)
+    tdoc = team.to_doc()
+    try:
+        await db.teams.insert_one(tdoc)
+    except DuplicateKeyError as e:
+        raise duplicate_team_error(e)
+    team_keys.add(tdoc)
     return {
         "teamId": tdoc["_id"],
         "message": f"Team '{payload.teamName}' from {payload.country} created successfully."
@@ -342,50 +1347,262 @@ async def autofill_team(team_id: str):
     team = await db.teams.find_one({"_id": team_id})
     if not team:
         raise HTTPException(status_code=404, detail="Team not found")
-    # create 23 players ensuring at least 2 GK
-    squad_ids = []
-    # ensure GK count 2
-    gk_positions = ["GK", "GK"]
-    other_positions = []
-    # fill remaining 21 positions with weighted distribution
-    other_positions.extend(random.choices(POSITIONS, weights=[0, 7, 8, 6], k=21))
-    positions = gk_positions + other_positions
-    random.shuffle(positions)
-    # pick random captain index
-    cap_idx = random.randrange(23)
-    for i, pos in enumerate(positions):
-        p = generate_player(natural_pos=pos, make_captain=(i == cap_idx))
-        pid = make_id("pl")
-        p_doc = p.dict()
-        p_doc["_id"] = pid
-        p_doc["teamId"] = team_id
-        await db.players.insert_one(p_doc)
-        squad_ids.append(pid)
-    # update team
+    # create 23 players ensuring at least 2 GK (one vectorised squad, one insert)
+    cols = generate_squads(1, team_ids=[team_id])
+    docs = player_docs(cols, range(SQUAD_SIZE))
+    await db.players.insert_many(docs)
+    squad_ids = [d["_id"] for d in docs]
+    # rating = best XI in the team's own formation, cached with the lineup
     await db.teams.update_one({"_id": team_id}, {"$set": {"squad": squad_ids}})
-    # recompute rating using helper
-    team_rating = await compute_team_rating(team_id)
-    await db.teams.update_one({"_id": team_id}, {"$set": {"rating": team_rating}})
+    team_rating = (await refresh_team_lineup(team_id))["rating"]
 
     return {"teamId": team_id, "squadCount": len(squad_ids), "teamRating": team_rating}
 
+# Default team responses leave out legacy embedded history arrays (see /teams/{id}/history)
+TEAM_SLIM_PROJECTION = {"finalsHistory": 0, "winnersHistory": 0}
+
 # --- Team list endpoint ---
 @app.get("/teams")
+@cached("teams")
 async def list_teams():
-    cursor = db.teams.find({})
+    cursor = db.teams.find({}, TEAM_SLIM_PROJECTION)
     res = []
     async for doc in cursor:
         res.append(doc)
-    return res
+    return MongoJSONResponse(res)
+
+# --- Bulk squad import/export (columnar NumPy .npz) ---
+# archive key -> team/player document field; strings are stored as fixed-width
+# unicode arrays so the archive always loads with allow_pickle=False
+TEAM_COLUMNS = {
+    "team_id": "_id",
+    "team_country": "country",
+    "team_teamName": "teamName",
+    "team_managerName": "managerName",
+    "team_representativeEmail": "representativeEmail",
+    "team_formation": "formation",
+}
+# archives from before a column existed get its default on import
+TEAM_COLUMN_DEFAULTS = {"team_formation": DEFAULT_FORMATION}
+TEAM_COUNTER_COLUMNS = {
+    "team_wins": "wins",
+    "team_losses": "losses",
+    "team_finalsCount": "finalsCount",
+    "team_titlesCount": "titlesCount",
+}
+PLAYER_COLUMNS = {
+    "player_id": "_id",
+    "player_teamId": "teamId",
+    "player_name": "name",
+    "player_naturalPosition": "naturalPosition",
+}
+BULK_INSERT_BATCH = 5000            # docs per insert_many call
+BULK_STREAM_CHUNK = 64 * 1024       # bytes per streamed response chunk
+BULK_SPOOL_MAX = 32 * 1024 * 1024   # archives larger than this spill to disk
+
+
+def _str_column(values) -> np.ndarray:
+    return np.array([v if v is not None else "" for v in values], dtype=str)
+
+
+async def bulk_insert(collection, docs: List[Dict[str, Any]]) -> List[int]:
+    """
+    Insert docs in unordered batches. Returns indices (into docs) that were
+    rejected, e.g. by a unique index, instead of aborting the whole load.
+    """
+    failed = []
+    for start in range(0, len(docs), BULK_INSERT_BATCH):
+        batch = docs[start:start + BULK_INSERT_BATCH]
+        try:
+            await collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            failed.extend(start + err["index"] for err in e.details.get("writeErrors", []))
+    return failed
+
+
+@app.get("/teams/export")
+async def export_teams(admin=Depends(admin_required)):
+    """
+    Dump all teams and players as a columnar .npz archive.
+    Player ratings are packed into an (N, 4) uint8 matrix in POSITIONS order.
+    """
+    team_cols = {key: [] for key in TEAM_COLUMNS}
+    team_counters = {key: [] for key in TEAM_COUNTER_COLUMNS}
+    async for t in db.teams.find({}, {**TEAM_SLIM_PROJECTION, "squad": 0}):
+        for key, doc_field in TEAM_COLUMNS.items():
+            team_cols[key].append(t.get(doc_field, TEAM_COLUMN_DEFAULTS.get(key)))
+        for key, doc_field in TEAM_COUNTER_COLUMNS.items():
+            team_counters[key].append(t.get(doc_field, 0))
+
+    player_cols = {key: [] for key in PLAYER_COLUMNS}
+    ratings, captains, images = [], [], []
+    async for p in db.players.find({}).batch_size(BULK_INSERT_BATCH):
+        for key, doc_field in PLAYER_COLUMNS.items():
+            player_cols[key].append(p.get(doc_field))
+        r = p.get("ratings", {})
+        ratings.append([r.get(pos, 0) for pos in POSITIONS])
+        captains.append(bool(p.get("isCaptain")))
+        images.append(p.get("imageUrl"))
+
+    arrays = {key: _str_column(vals) for key, vals in {**team_cols, **player_cols}.items()}
+    for key, vals in team_counters.items():
+        arrays[key] = np.array(vals, dtype=np.int32)
+    arrays["player_ratings"] = np.array(ratings, dtype=np.uint8).reshape(-1, len(POSITIONS))
+    arrays["player_isCaptain"] = np.array(captains, dtype=bool)
+    arrays["player_imageUrl"] = _str_column(images)
+
+    spool = tempfile.SpooledTemporaryFile(max_size=BULK_SPOOL_MAX)
+    await asyncio.to_thread(np.savez_compressed, spool, **arrays)
+    spool.seek(0)
+
+    def iter_archive():
+        with spool:
+            while chunk := spool.read(BULK_STREAM_CHUNK):
+                yield chunk
+
+    return StreamingResponse(
+        iter_archive(),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": 'attachment; filename="squads.npz"'}
+    )
+
+
+@app.post("/teams/import")
+async def import_teams(request: Request, admin=Depends(admin_required)):
+    """
+    Load teams and players from a .npz archive (same layout as /teams/export),
+    sent as the raw request body.
+    Teams with an unknown country, or whose country/teamName is already taken,
+    are skipped together with their players; everything else is bulk inserted.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=BULK_SPOOL_MAX)
+    with spool:
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+        try:
+            with np.load(spool, allow_pickle=False) as archive:
+                cols = {key: archive[key] for key in archive.files}
+        except (ValueError, OSError, zipfile.BadZipFile):
+            raise HTTPException(status_code=400, detail="Body must be a .npz archive")
+
+    missing = [k for k in [*TEAM_COLUMNS, *PLAYER_COLUMNS, "player_ratings"]
+               if k not in cols and k not in TEAM_COLUMN_DEFAULTS]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Archive is missing columns: {', '.join(missing)}")
+
+    n_teams, n_players = len(cols["team_id"]), len(cols["player_id"])
+    for key, default in TEAM_COLUMN_DEFAULTS.items():
+        if key not in cols:
+            cols[key] = np.full(n_teams, default)
+    for key in TEAM_COUNTER_COLUMNS:
+        if key not in cols:
+            cols[key] = np.zeros(n_teams, dtype=np.int32)
+    ratings = np.clip(cols["player_ratings"].astype(np.int64), 0, 100)
+    if ratings.shape != (n_players, len(POSITIONS)):
+        raise HTTPException(status_code=400, detail="player_ratings must be an (N, 4) matrix")
+
+    # --- validate teams: known country and formation, no duplicate country/teamName inside the file
+    countries = cols["team_country"]
+    team_ok = np.isin(countries, AFRICAN_COUNTRIES)
+    rejected = [
+        {"teamId": str(cols["team_id"][i]), "country": str(countries[i]), "reason": "Invalid country"}
+        for i in np.flatnonzero(~team_ok)
+    ]
+    formation_ok = np.isin(cols["team_formation"], list(FORMATIONS))
+    for i in np.flatnonzero(team_ok & ~formation_ok):
+        rejected.append({"teamId": str(cols["team_id"][i]), "country": str(countries[i]), "reason": "Unknown formation"})
+    team_ok &= formation_ok
+    for key in ("team_id", "team_country", "team_teamName"):
+        _, first = np.unique(cols[key], return_index=True)
+        dup = np.ones(n_teams, dtype=bool)
+        dup[first] = False
+        for i in np.flatnonzero(dup & team_ok):
+            rejected.append({"teamId": str(cols["team_id"][i]), "country": str(countries[i]),
+                             "reason": f"Duplicate {TEAM_COLUMNS[key]} in archive"})
+        team_ok &= ~dup
+
+    # --- validate players: known position, a team that survived validation, and
+    # the first row of a duplicated player_id
+    pos_idx = np.full(n_players, -1)
+    for i, pos in enumerate(POSITIONS):
+        pos_idx[cols["player_naturalPosition"] == pos] = i
+    _, first = np.unique(cols["player_id"], return_index=True)
+    first_row = np.zeros(n_players, dtype=bool)
+    first_row[first] = True
+    player_ok = (pos_idx >= 0) & first_row & np.isin(cols["player_teamId"], cols["team_id"][team_ok])
+
+    # team rating = best XI of the squad in the team's formation (see best_lineup)
+    # a duplicated team_id keeps its first row (later rows were rejected above)
+    team_index = {}
+    for i, tid in enumerate(cols["team_id"].tolist()):
+        team_index.setdefault(tid, i)
+    owner = np.array([team_index.get(t, -1) for t in cols["player_teamId"].tolist()], dtype=np.int64)
+    kept = np.flatnonzero(player_ok)
+    by_team = kept[np.argsort(owner[kept], kind="stable")]
+    squad_size = np.bincount(owner[kept], minlength=n_teams)
+    team_rating = await run_cpu(lineup_ratings, ratings[by_team], squad_size, cols["team_formation"].tolist())
+
+    squads = [[] for _ in range(n_teams)]
+    for i in kept:
+        squads[owner[i]].append(str(cols["player_id"][i]))
+
+    now = datetime.utcnow()
+    team_rows = np.flatnonzero(team_ok)
+    team_docs = []
+    for i in team_rows:
+        doc = {doc_field: str(cols[key][i]) for key, doc_field in TEAM_COLUMNS.items()}
+        doc.update({
+            "squad": squads[i],
+            "rating": float(team_rating[i]),
+            "createdAt": now,
+            **{doc_field: int(cols[key][i]) for key, doc_field in TEAM_COUNTER_COLUMNS.items()}
+        })
+        team_docs.append(doc)
+
+    # unique country/teamName indexes reject clashes with existing teams
+    failed_teams = set()
+    failed_docs = set(await bulk_insert(db.teams, team_docs))
+    for j in sorted(failed_docs):
+        i = team_rows[j]
+        failed_teams.add(int(i))
+        rejected.append({"teamId": str(cols["team_id"][i]), "country": str(countries[i]),
+                         "reason": "Team id, country or teamName already exists"})
+    for j, doc in enumerate(team_docs):
+        if j not in failed_docs:
+            team_keys.add(doc)
+    if failed_docs:
+        team_keys.invalidate()
+
+    cols["player_ratings"] = ratings
+    docs = player_docs(cols, [i for i in kept if owner[i] not in failed_teams])
+    failed_players = [docs[j] for j in await bulk_insert(db.players, docs)]
+    if failed_players:
+        # keep squads, and the ratings built from them, consistent with what actually landed
+        short_teams = list({p["teamId"] for p in failed_players})
+        await db.teams.update_many(
+            {"_id": {"$in": short_teams}},
+            {"$pull": {"squad": {"$in": [p["_id"] for p in failed_players]}}}
+        )
+        for team_id in short_teams:
+            await refresh_team_lineup(team_id)
+
+    return {
+        "teamsImported": len(team_docs) - len(failed_teams),
+        "playersImported": len(docs) - len(failed_players),
+        "playersRejected": n_players - len(docs) + len(failed_players),
+        "rejectedTeams": rejected
+    }
 
 # --- Team CRUD Endpoints ---
 @app.get("/teams/{team_id}")
+@cached("teams:{team_id}", "players")
 async def get_team(team_id: str, expand_players: bool = False):
     """
     Get a team by ID.
     expand_players=True will include full player objects instead of just IDs.
     """
-    team = await db.teams.find_one({"_id": team_id})
+    team = await db.teams.find_one({"_id": team_id}, TEAM_SLIM_PROJECTION)
     if not team:
         raise HTTPException(status_code=404, detail="Team not found")
     team_copy = team.copy()
@@ -393,56 +1610,39 @@ async def get_team(team_id: str, expand_players: bool = False):
         players = await db.players.find({"_id": {"$in": team["squad"]}}).to_list(length=None)
         team_copy["squad"] = players
 
-    return team_copy
-from pymongo.errors import DuplicateKeyError
-
+    return MongoJSONResponse(team_copy)
 @app.put("/teams/{team_id}")
 async def update_team(team_id: str, payload: CreateTeamPayload = Body(...)):
     """
     Update country, teamName, managerName, or representativeEmail of a team.
     Both country and teamName must remain unique.
     """
-    team = await db.teams.find_one({"_id": team_id})
-    if not team:
-        raise HTTPException(status_code=404, detail="Team not found")
-
     # OPTIONAL: normalize inputs (trim)
     country = payload.country.strip()
     team_name = payload.teamName.strip()
 
-    # Pre-checks (exclude self to avoid false positives)
-    if country != team["country"]:
-        existing_country = await db.teams.find_one({
-            "country": country,
-            "_id": {"$ne": team_id}
-        })
-        if existing_country:
-            raise HTTPException(status_code=400, detail="Another team with this country already exists")
-
-    if team_name != team["teamName"]:
-        existing_name = await db.teams.find_one({
-            "teamName": team_name,
-            "_id": {"$ne": team_id}
-        })
-        if existing_name:
-            raise HTTPException(status_code=400, detail="Another team with this name already exists")
-
+    # single write; the unique indexes reject a country/name held by another team
     try:
-        await db.teams.update_one(
+        old = await db.teams.find_one_and_update(
             {"_id": team_id},
             {"$set": {
                 "country": country,
                 "teamName": team_name,
                 "managerName": payload.managerName,
                 "representativeEmail": payload.representativeEmail
-            }}
+            }},
+            projection={f: 1 for f in TEAM_KEY_FIELDS}
         )
     except DuplicateKeyError as e:
-        # In case of concurrent updates slipping through pre-checks
-        msg = "A team with this name already exists."
-        if "country" in str(e):
-            msg = "Another team with this country already exists"
-        raise HTTPException(status_code=400, detail=msg)
+        team_keys.invalidate()
+        field = duplicate_team_field(e)
+        detail = "Another team with this country already exists" if field == "country" \
+            else "Another team with this name already exists"
+        raise HTTPException(status_code=400, detail=detail)
+    if not old:
+        raise HTTPException(status_code=404, detail="Team not found")
+    team_keys.discard(old)
+    team_keys.add({"_id": team_id, "country": country, "teamName": team_name})
 
     return {
         "teamId": team_id,
@@ -456,6 +1656,36 @@ async def update_team(team_id: str, payload: CreateTeamPayload = Body(...)):
     }
 
 
+# --- Starting XI ---
+@app.get("/teams/{team_id}/lineup")
+async def get_team_lineup(team_id: str, formation: Optional[str] = None):
+    """
+    Best starting XI. Served from the team's cached lineup; ?formation= previews
+    another shape without changing the team.
+    """
+    if formation is not None and formation not in FORMATIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown formation. Use one of: {', '.join(FORMATIONS)}")
+    team = await db.teams.find_one({"_id": team_id}, {"formation": 1, "lineup": 1, "squad": 1})
+    if not team:
+        raise HTTPException(status_code=404, detail="Team not found")
+
+    team_formation = team.get("formation", DEFAULT_FORMATION)
+    if formation is None or formation == team_formation:
+        return team.get("lineup") or await refresh_team_lineup(team_id)
+
+    players = await db.players.find({"_id": {"$in": team.get("squad", [])}}, {"name": 1, "ratings": 1}).to_list(None)
+    return build_lineup(players, formation)
+
+@app.put("/teams/{team_id}/formation")
+async def set_team_formation(team_id: str, payload: FormationPayload):
+    """Change the team's formation; its XI and rating follow."""
+    if payload.formation not in FORMATIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown formation. Use one of: {', '.join(FORMATIONS)}")
+    lineup = await refresh_team_lineup(team_id, payload.formation)
+    if lineup is None:
+        raise HTTPException(status_code=404, detail="Team not found")
+    return {"teamId": team_id, "lineup": lineup}
+
 # --- Admin: Remove a team and players ---
 @app.delete("/teams/{team_id}")
 async def delete_team(team_id: str):
@@ -480,54 +1710,124 @@ async def delete_team(team_id: str):
     await db.players.delete_many({"teamId": team_id})
     # delete team
     await db.teams.delete_one({"_id": team_id})
+    team_keys.discard(team)
 
     return {"teamId": team_id, "message": "Team and its players deleted successfully"}
 
 
 
 # --- Admin: Replace a team before tournament starts ---
+# The swap is all-or-nothing: everything that can be checked up front is, then the
+# old team + squad go and the new team (+ optional squad) arrive in one ordered
+# bulk_write per collection inside a transaction. A clash on the unique
+# country/teamName indexes aborts it with the old team untouched. Transactions need
+# a replica set (or mongos); on a standalone mongod the same writes run with a
+# compensating restore instead.
+transactions_supported: Optional[bool] = None
+
+async def supports_transactions() -> bool:
+    global transactions_supported
+    if transactions_supported is None:
+        try:
+            hello = await client.admin.command("hello")
+            transactions_supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        except Exception:
+            transactions_supported = False
+    return transactions_supported
+
+def bulk_duplicate(e: BulkWriteError) -> Optional[DuplicateKeyError]:
+    """The unique-index violation inside a BulkWriteError, as a DuplicateKeyError."""
+    dup = next((w for w in e.details.get("writeErrors", []) if w.get("code") == 11000), None)
+    return DuplicateKeyError(dup.get("errmsg", ""), 11000, dup) if dup else None
+
+async def swap_team(old_id: str, team_doc: Dict[str, Any], squad: List[Dict[str, Any]]) -> bool:
+    """Replace team old_id (and its players) with team_doc (and squad). False if old_id is gone."""
+    team_ops = [DeleteOne({"_id": old_id}), InsertOne(team_doc)]
+    player_ops = [DeleteMany({"teamId": old_id})] + [InsertOne(p) for p in squad]
+
+    if await supports_transactions():
+        async with await client.start_session() as session:
+            async with session.start_transaction():
+                try:
+                    res = await db.teams.bulk_write(team_ops, ordered=True, session=session)
+                except BulkWriteError as e:
+                    raise bulk_duplicate(e) or e
+                if not res.deleted_count:
+                    await session.abort_transaction()
+                    return False
+                await db.players.bulk_write(player_ops, ordered=True, session=session)
+        return True
+
+    # standalone: keep what we delete so a failed insert can put it back
+    old_team = await db.teams.find_one({"_id": old_id})
+    if not old_team:
+        return False
+    old_players = await db.players.find({"teamId": old_id}).to_list(length=None)
+    try:
+        await db.teams.bulk_write(team_ops, ordered=True)
+    except BulkWriteError as e:
+        if e.details.get("nInserted", 0) == 0 and e.details.get("nRemoved", 0):
+            await db.teams.insert_one(old_team)
+        raise bulk_duplicate(e) or e
+    try:
+        await db.players.bulk_write(player_ops, ordered=True)
+    except Exception:
+        await db.teams.bulk_write([DeleteOne({"_id": team_doc["_id"]}), InsertOne(old_team)], ordered=True)
+        await db.players.bulk_write(
+            [DeleteMany({"teamId": {"$in": [old_id, team_doc["_id"]]}})] + [InsertOne(p) for p in old_players],
+            ordered=True
+        )
+        raise
+    return True
+
 @app.post("/teams/replace")
 async def replace_team(payload: ReplaceTeamPayload, admin=Depends(admin_required)):
-    # 1) Check if tournament has already started
-    active = await db.tournaments.find_one({"status": "in_progress"})
+    # 1) Validate everything before touching data
+    if payload.country not in AFRICAN_COUNTRIES:
+        raise HTTPException(status_code=400, detail="Invalid country.")
+    active, team = await asyncio.gather(
+        db.tournaments.find_one({"status": "in_progress"}, {"_id": 1}),
+        db.teams.find_one({"_id": payload.remove_team_id}, {f: 1 for f in TEAM_KEY_FIELDS}),
+    )
     if active:
         raise HTTPException(status_code=400, detail="Cannot replace teams after tournament has started")
-
-    # 2) Delete existing team + players
-    team = await db.teams.find_one({"_id": payload.remove_team_id})
     if not team:
         raise HTTPException(status_code=404, detail="Team to remove not found")
+    keys = await team_keys.fresh()
+    for f, value in (("country", payload.country), ("teamName", payload.teamName)):
+        if keys.owners[f].get(value, team["_id"]) != team["_id"]:
+            raise HTTPException(status_code=400, detail=DUPLICATE_TEAM_DETAIL[f])
 
-    await db.players.delete_many({"teamId": payload.remove_team_id})
-    await db.teams.delete_one({"_id": payload.remove_team_id})
-
-    # 3) Create new team using same validation logic (copy from create_team)
-    if payload.country not in AFRICAN_COUNTRIES:
-        raise HTTPException(status_code=400, detail="Invalid country.")
-
-    existing = await db.teams.find_one({"country": payload.country})
-    if existing:
-      raise HTTPException(status_code=400, detail="A team for this country already exists.")
-
-    existing_name = await db.teams.find_one({"teamName": payload.teamName})
-    if existing_name:
-      raise HTTPException(status_code=400, detail="A team with this name already exists.")
-
+    # 2) Build the new team (and squad) in memory
     new_team = TeamInDB(
         country=payload.country,
         teamName=payload.teamName,
         managerName=payload.managerName,
         representativeEmail=payload.representativeEmail
     )
+    doc = new_team.to_doc()
+    new_team_id = doc["_id"]
+    squad = []
+    if payload.autofill:
+        squad = player_docs(generate_squads(1, team_ids=[new_team_id]), range(SQUAD_SIZE))
+        lineup = build_lineup(squad, doc["formation"])
+        doc.update({"squad": [p["_id"] for p in squad], "lineup": lineup, "rating": lineup["rating"]})
 
-    doc = new_team.dict()
-    new_team_id = make_id("team")
-    doc["_id"] = new_team_id
-    await db.teams.insert_one(doc)
+    # 3) Swap atomically
+    try:
+        swapped = await swap_team(payload.remove_team_id, doc, squad)
+    except DuplicateKeyError as e:
+        raise duplicate_team_error(e)
+    if not swapped:
+        raise HTTPException(status_code=404, detail="Team to remove not found")
+    team_keys.discard(team)
+    team_keys.add(doc)
 
     return {
         "old_team_removed": payload.remove_team_id,
         "new_team_id": new_team_id,
+        "squadCount": len(squad),
+        "teamRating": doc["rating"],
         "message": f"Team replaced successfully. {payload.teamName} created."
     }
 
@@ -541,6 +1841,7 @@ async def remove_all_teams(admin=Depends(admin_required)):
     await db.players.delete_many({})
     # Delete all teams
     await db.teams.delete_many({})
+    team_keys.clear()
     return {"message": "All teams and players have been removed successfully."}
 
 
@@ -551,20 +1852,20 @@ async def search_teams(query: str):
     Search for teams by partial country name (case-insensitive).
     Example: /teams/search?query=ni
     """
-    cursor = db.teams.find({"country": {"$regex": query, "$options": "i"}})
+    cursor = db.teams.find({"country": {"$regex": query, "$options": "i"}}, TEAM_SLIM_PROJECTION)
     results = await cursor.to_list(length=None)
-    return results
+    return MongoJSONResponse(results)
 
 @app.get("/teams/{team_id}/stats")
 async def get_team_stats(team_id: str):
-    team = await db.teams.find_one({"_id": team_id})
+    team = await db.teams.find_one({"_id": team_id}, TEAM_SLIM_PROJECTION)
     if not team:
         raise HTTPException(status_code=404, detail="Team not found")
 
     wins = team.get("wins", 0)
     losses = team.get("losses", 0)
-    finals = team.get("finalsHistory", [])
-    winners = team.get("winnersHistory", [])
+    finals = await db.team_history.find({"teamId": team_id}, {"_id": 0, "teamId": 0}).sort("date", -1).to_list(length=None)
+    winners = [f for f in finals if f.get("result") == "winner"]
 
     return {
         "teamId": team_id,
@@ -578,17 +1879,45 @@ async def get_team_stats(team_id: str):
         "winnersHistory": winners
     }
 
+@app.get("/teams/{team_id}/history")
+async def get_team_history(team_id: str, result: Optional[str] = None,
+                           limit: int = Query(50, ge=1, le=500), skip: int = Query(0, ge=0)):
+    """
+    Finals history for a team, newest first. result=winner returns titles only.
+    """
+    query = {"teamId": team_id}
+    if result:
+        query["result"] = result
+    cursor = db.team_history.find(query).sort("date", -1).skip(skip).limit(limit)
+    return await cursor.to_list(length=None)
+
 @app.post("/admin/backfill_team_stats")
 async def backfill_team_stats(admin=Depends(admin_required)):
+    """
+    Fill missing counters and move legacy embedded finalsHistory/winnersHistory
+    arrays out of team documents into team_history.
+    """
     cursor = db.teams.find({})
     async for t in cursor:
-        updates = {}
+        updates, unset = {}, {}
         if "wins" not in t: updates["wins"] = 0
         if "losses" not in t: updates["losses"] = 0
-        if "finalsHistory" not in t: updates["finalsHistory"] = []
-        if "winnersHistory" not in t: updates["winnersHistory"] = []
-        if updates:
-            await db.teams.update_one({"_id": t["_id"]}, {"$set": updates})
+        legacy = t.get("finalsHistory")
+        if legacy is not None or "winnersHistory" in t:
+            entries = [{**entry, "_id": make_id("hist"), "teamId": t["_id"]} for entry in legacy or []]
+            if entries:
+                await db.team_history.insert_many(entries)
+            updates["finalsCount"] = t.get("finalsCount", 0) + len(entries)
+            updates["titlesCount"] = t.get("titlesCount", 0) + sum(1 for e in entries if e.get("result") == "winner")
+            unset = {"finalsHistory": "", "winnersHistory": ""}
+        else:
+            if "finalsCount" not in t: updates["finalsCount"] = 0
+            if "titlesCount" not in t: updates["titlesCount"] = 0
+        if updates or unset:
+            op = {"$set": updates}
+            if unset:
+                op["$unset"] = unset
+            await db.teams.update_one({"_id": t["_id"]}, op)
     return {"message": "Backfill complete"}
 
 
@@ -596,10 +1925,12 @@ async def backfill_team_stats(admin=Depends(admin_required)):
 async def list_countries():
     return {"countries": AFRICAN_COUNTRIES}
 
-@app.get("/meta/countries/available")
+@app.get("/meta/countries/available", dependencies=[Depends(public_rate_limit)])
+@coalesced
 async def list_available_countries():
-    taken = await db.teams.distinct("country")
-    available = [c for c in AFRICAN_COUNTRIES if c not in set(taken)]
+    keys = await team_keys.fresh()
+    taken = keys.taken("country")
+    available = [c for c in AFRICAN_COUNTRIES if c not in keys.owners["country"]]
     return {"available": available, "taken": taken}
 
 # --- Player CRUD Endpoints ---
@@ -619,7 +1950,7 @@ async def list_players():
     """
     cursor = db.players.find({})
     players = await cursor.to_list(length=None)
-    return players
+    return MongoJSONResponse(players)
 
 @app.get("/players/{player_id}")
 async def get_player(player_id: str):
@@ -652,12 +1983,11 @@ async def update_player(player_id: str, payload: UpdatePlayerPayload = Body(...)
         
     await db.players.update_one({"_id": player_id}, {"$set": update_data})
 
-    # If ratings or naturalPosition changed, recompute team rating using helper
+    # If ratings changed, the best XI (and so the team rating) may have too
     if "ratings" in update_data or "naturalPosition" in update_data:
         team_id = player.get("teamId")
         if team_id:
-            team_rating = await compute_team_rating(team_id)
-            await db.teams.update_one({"_id": team_id}, {"$set": {"rating": team_rating}})
+            await refresh_team_lineup(team_id)
 
 
     updated_player = await db.players.find_one({"_id": player_id})
@@ -675,11 +2005,10 @@ async def delete_player(player_id: str):
     team_id = player.get("teamId")
     await db.players.delete_one({"_id": player_id})
 
-    # Update team squad and rating using helper
+    # Update team squad, best XI and rating
     if team_id:
         await db.teams.update_one({"_id": team_id}, {"$pull": {"squad": player_id}})
-        team_rating = await compute_team_rating(team_id)
-        await db.teams.update_one({"_id": team_id}, {"$set": {"rating": team_rating}})
+        await refresh_team_lineup(team_id)
 
 
     return {"playerId": player_id, "message": "Player deleted successfully"}
@@ -693,47 +2022,56 @@ async def search_players(query: str):
     """
     cursor = db.players.find({"name": {"$regex": query, "$options": "i"}})
     results = await cursor.to_list(length=None)
-    return results
+    return MongoJSONResponse(results)
 
 # --- Tournament management ---
+DEMO_TEAMS = [
+    {"country": "Ghana", "teamName": "Black Stars"},
+    {"country": "Senegal", "teamName": "Lions of Teranga"},
+    {"country": "Egypt", "teamName": "Pharaohs"},
+    {"country": "Morocco", "teamName": "Atlas Lions"},
+    {"country": "Algeria", "teamName": "Desert Foxes"},
+    {"country": "Nigeria", "teamName": "Super Eagles"},
+    {"country": "Cameroon", "teamName": "Indomitable Lions"},
+]
+
+async def seed_demo_squads(job: Optional["MaintenanceJob"] = None) -> List[str]:
+    """Insert the 7 demo teams with full squads: one generated batch, batched inserts."""
+    teams = [
+        TeamInDB(
+            country=d["country"],
+            teamName=d["teamName"],
+            managerName=f"Manager {d['country']}",
+            representativeEmail=f"rep_{d['country'].lower()}@example.com"
+        ).to_doc()
+        for d in DEMO_TEAMS
+    ]
+    cols = generate_squads(len(teams), team_ids=[t["_id"] for t in teams])
+    players = player_docs(cols, range(len(teams) * SQUAD_SIZE))
+    for k, t in enumerate(teams):
+        squad = players[k * SQUAD_SIZE:(k + 1) * SQUAD_SIZE]
+        lineup = build_lineup(squad, t["formation"])
+        t.update({"squad": [p["_id"] for p in squad], "lineup": lineup, "rating": lineup["rating"]})
+    await insert_in_batches(db.teams, teams, job)
+    for t in teams:
+        team_keys.add(t)
+    await insert_in_batches(db.players, players, job)
+    return [t["_id"] for t in teams]
+
 @app.post("/seed/create_demo_teams")
 async def seed_create_demo_teams(admin=Depends(admin_required)):
-    await db.teams.drop()  # removes all previous teams
+    await drop_and_recreate(db.teams)  # removes all previous teams
     await db.players.delete_many({})
+    team_keys.clear()
     # create 7 demo teams with autofilled squads
-    created = []
-    demo_data = [
-        {"country": "Ghana", "teamName": "Black Stars"},
-        {"country": "Senegal", "teamName": "Lions of Teranga"},
-        {"country": "Egypt", "teamName": "Pharaohs"},
-        {"country": "Morocco", "teamName": "Atlas Lions"},
-        {"country": "Algeria", "teamName": "Desert Foxes"},
-        {"country": "Nigeria", "teamName": "Super Eagles"},
-        {"country": "Cameroon", "teamName": "Indomitable Lions"},
-    ]
-
-    for data in demo_data:
-        tdoc = {
-            "_id": make_id("team"),
-            "country": data["country"],
-            "teamName": data["teamName"],   # NEW
-            "managerName": f"Manager {data['country']}",
-            "representativeEmail": f"rep_{data['country'].lower()}@example.com",
-            "squad": [],
-            "rating": 0.0,
-            "createdAt": datetime.utcnow()
-        }
-        await db.teams.insert_one(tdoc)
-        await autofill_team(tdoc["_id"])
-        created.append(tdoc["_id"])
-
+    created = await seed_demo_squads()
     return {"created": created}
 
 @app.post("/seed/add_demo_team")
 async def seed_add_demo_team(admin=Depends(admin_required)):
     # get all taken countries
-    taken = await db.teams.distinct("country")
-    available = [c for c in AFRICAN_COUNTRIES if c not in set(taken)]
+    keys = await team_keys.fresh()
+    available = [c for c in AFRICAN_COUNTRIES if c not in keys.owners["country"]]
 
     if not available:
         raise HTTPException(status_code=400, detail="No available African countries left to assign a demo team.")
@@ -755,12 +2093,286 @@ async def seed_add_demo_team(admin=Depends(admin_required)):
         "createdAt": datetime.utcnow()
     }
 
-    await db.teams.insert_one(tdoc)
+    try:
+        await db.teams.insert_one(tdoc)
+    except DuplicateKeyError as e:
+        raise duplicate_team_error(e)
+    team_keys.add(tdoc)
     await autofill_team(tdoc["_id"])
 
     return {"teamId": tdoc["_id"], "country": country, "teamName": team_name}
 
+# --- Load testing: mass synthetic players ---
+LOAD_TEST_CHUNK_TEAMS = 2000  # squads generated + inserted per chunk (46k players)
+
+@app.post("/seed/load_test_players")
+async def seed_load_test_players(teams: int = Query(1000, ge=1, le=100_000), admin=Depends(admin_required)):
+    """
+    Bulk-insert `teams` synthetic squads (23 players each) for load testing the
+    player listing/search paths. Players get synthetic team ids and loadTest=True
+    so they never clash with real teams and can be removed in one call.
+    """
+    inserted = await seed_load_test_squads(teams)
+    return {"teams": teams, "playersInserted": inserted}
+
+async def seed_load_test_squads(teams: int, job: Optional["MaintenanceJob"] = None) -> int:
+    if job:
+        job.start_phase("insert load-test players", teams * SQUAD_SIZE)
+    inserted = 0
+    for start in range(0, teams, LOAD_TEST_CHUNK_TEAMS):
+        k = min(LOAD_TEST_CHUNK_TEAMS, teams - start)
+        cols = generate_squads(k, team_ids=make_ids("loadteam", k))
+        docs = player_docs(cols, range(k * SQUAD_SIZE))
+        for d in docs:
+            d["loadTest"] = True
+        inserted += len(docs) - len(await bulk_insert(db.players, docs))
+        if job:
+            job.advance(inserted)
+    return inserted
+
+@app.delete("/seed/load_test_players")
+async def clear_load_test_players(admin=Depends(admin_required)):
+    res = await db.players.delete_many({"loadTest": True})
+    return {"playersDeleted": res.deleted_count}
+
+
+
+# --- Season archive: finished tournaments + their matches leave the live collections ---
+async def next_season_number() -> int:
+    counter = await db.counters.find_one_and_update(
+        {"_id": "season"},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"]
+
+async def archive_tournament(tournament: dict) -> int:
+    """
+    Move one tournament and its matches into a single season_archive document,
+    then remove them from the live tournaments/matches collections.
+    Safe to re-run: an already archived tournament keeps its season number.
+    """
+    tour_id = tournament["_id"]
+    matches = await db.matches.find({"tournamentId": tour_id}).to_list(length=None)
+    existing = await db.season_archive.find_one({"_id": tour_id}, {"season": 1})
+    season = existing["season"] if existing else await next_season_number()
+
+    await db.season_archive.replace_one({"_id": tour_id}, {
+        "season": season,
+        "status": tournament.get("status"),
+        "winner": tournament.get("winner"),
+        "winnerName": tournament.get("winnerName"),
+        "teams": tournament.get("teams", []),
+        "createdAt": tournament.get("createdAt"),
+        "archivedAt": datetime.utcnow(),
+        "tournament": tournament,
+        "matches": matches
+    }, upsert=True)
+
+    await db.matches.delete_many({"tournamentId": tour_id})
+    await db.tournaments.delete_one({"_id": tour_id})
+    return season
+
+async def archive_finished_tournaments() -> List[int]:
+    finished = await db.tournaments.find({"status": "finished"}).sort("createdAt", 1).to_list(length=None)
+    return [await archive_tournament(t) for t in finished]
+
+@app.post("/tournament/archive")
+async def archive_finished(admin=Depends(admin_required)):
+    seasons = await archive_finished_tournaments()
+    return {"archivedSeasons": seasons}
+
+@app.get("/seasons")
+async def list_seasons(limit: int = Query(20, ge=1, le=200), skip: int = Query(0, ge=0)):
+    """
+    Archived seasons, newest first (summary only, no matches).
+    """
+    cursor = db.season_archive.find({}, {"tournament": 0, "matches": 0}).sort("season", -1).skip(skip).limit(limit)
+    return await cursor.to_list(length=None)
+
+@app.get("/seasons/{season}")
+async def get_season(season: int):
+    doc = await db.season_archive.find_one({"season": season})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Season not found")
+    return doc
+
+@app.get("/seasons/{season}/topscorers")
+async def get_season_top_scorers(season: int, limit: int = 10):
+    pipeline = [
+        {"$match": {"season": season}},
+        {"$unwind": "$matches"},
+        {"$unwind": "$matches.goalEvents"},
+        {"$group": {"_id": "$matches.goalEvents.playerId", "goals": {"$sum": 1}}},
+        {"$sort": {"goals": -1}},
+        {"$limit": limit}
+    ]
+    results = await db.season_archive.aggregate(pipeline).to_list(length=None)
+    players = await db.players.find(
+        {"_id": {"$in": [r["_id"] for r in results]}}, {"name": 1, "teamId": 1}
+    ).to_list(length=None)
+    teams = await db.teams.find(
+        {"_id": {"$in": list({p.get("teamId") for p in players})}}, {"country": 1}
+    ).to_list(length=None)
+    names = {p["_id"]: p for p in players}
+    countries = {t["_id"]: t["country"] for t in teams}
+    for r in results:
+        player = names.get(r["_id"])
+        if player:
+            r["playerName"] = player["name"]
+            r["team"] = countries.get(player.get("teamId"))
+    return results
+
+
+# --- Tournament state machine ---
+# status in_progress -> (current_round QuarterFinal -> SemiFinal -> Final) -> finished.
+# Every transition is a compare-and-swap on "version", so concurrent workers or
+# double clicks can't advance a round twice. Only the in-progress tournament has
+# active=True, and a unique sparse index on it allows a single one at a time.
+TOURNAMENT_ROUNDS = ["QuarterFinal", "SemiFinal", "Final"]
+TRANSITION_RETRIES = 5
+
+def new_tournament_doc(tournament_id: str, teams: List[dict], matches: List[dict]) -> Dict[str, Any]:
+    info = {t["_id"]: t for t in teams}
+    return {
+        "_id": tournament_id,
+        "status": "in_progress",
+        "active": True,
+        "version": 0,
+        "current_round": TOURNAMENT_ROUNDS[0],
+        "bracket": [m["_id"] for m in matches],
+        "teams": [t["_id"] for t in teams],
+        "snapshot": {m["_id"]: snapshot_entry(m, info) for m in matches},
+        "snapshotVersion": 0,
+        "matchesPlayed": 0,
+        "createdAt": datetime.utcnow()
+    }
+
+# --- Bracket snapshot ---
+# tournament.snapshot[matchId] holds everything a bracket view shows for that slot,
+# so bracket/status reads are a single find_one. Entries are written when a round is
+# created and patched (with snapshotVersion += 1) as each match completes.
+SNAPSHOT_RESULT_FIELDS = ("status", "score", "winner", "winnerName", "wentExtra", "penalty_result", "playedAt")
+
+def snapshot_entry(match: dict, teams: Dict[str, dict]) -> Dict[str, Any]:
+    """teams: teamId -> {"country", "rating"} (team docs or earlier snapshot info)."""
+    home, away = teams.get(match["homeTeam"], {}), teams.get(match["awayTeam"], {})
+    entry = {
+        "_id": match["_id"],
+        "round": match["round"],
+        "slot": match.get("slot", 0),
+        "homeTeam": match["homeTeam"],
+        "awayTeam": match["awayTeam"],
+        "homeTeamName": home.get("country", match["homeTeam"]),
+        "awayTeamName": away.get("country", match["awayTeam"]),
+        "homeRating": float(home.get("rating", DEFAULT_TEAM_RATING)),
+        "awayRating": float(away.get("rating", DEFAULT_TEAM_RATING)),
+    }
+    entry.update({key: match.get(key) for key in SNAPSHOT_RESULT_FIELDS})
+    entry["status"] = match.get("status", "pending")
+    entry["score"] = match.get("score") or {"home": 0, "away": 0}
+    return entry
+
+def snapshot_team_info(snapshot: Dict[str, dict]) -> Dict[str, dict]:
+    info = {}
+    for e in snapshot.values():
+        info[e["homeTeam"]] = {"country": e["homeTeamName"], "rating": e["homeRating"]}
+        info[e["awayTeam"]] = {"country": e["awayTeamName"], "rating": e["awayRating"]}
+    return info
+
+async def record_snapshot_result(tournament_id: str, match_id: str, result: Dict[str, Any]):
+    """
+    Copy a played match into the snapshot; a no-op if it is already there, so it can
+    be repeated (advance_tournament_round does, for results whose copy never landed).
+    The ratings the match was played at, when the result has them, replace the
+    snapshot's for its odds.
+    """
+    fields = {f"snapshot.{match_id}.{key}": result.get(key) for key in SNAPSHOT_RESULT_FIELDS}
+    for key in ("homeRating", "awayRating"):
+        if result.get(key) is not None:
+            fields[f"snapshot.{match_id}.{key}"] = float(result[key])
+    await db.tournaments.update_one(
+        {"_id": tournament_id, f"snapshot.{match_id}": {"$exists": True},
+         f"snapshot.{match_id}.status": {"$ne": "simulated"}},
+        {"$set": fields, "$inc": {"snapshotVersion": 1, "matchesPlayed": 1}}
+    )
+
+async def pending_team_ratings(tour: dict) -> Dict[str, float]:
+    """Current ratings of the teams in the snapshot's unplayed matches."""
+    team_ids = {e[side] for e in tour["snapshot"].values() if e["status"] != "simulated"
+                for side in ("homeTeam", "awayTeam")}
+    if not team_ids:
+        return {}
+    return {t["_id"]: float(t.get("rating", DEFAULT_TEAM_RATING))
+            async for t in db.teams.find({"_id": {"$in": list(team_ids)}}, {"rating": 1})}
+
+async def ensure_bracket_snapshot(tour: dict) -> dict:
+    """Tournaments created before snapshots existed get one built (and stored) on first read."""
+    if "snapshot" in tour:
+        return tour
+    matches = await db.matches.find({"_id": {"$in": tour.get("bracket", [])}}).to_list(length=None)
+    team_ids = {m["homeTeam"] for m in matches} | {m["awayTeam"] for m in matches}
+    teams = {t["_id"]: t async for t in db.teams.find({"_id": {"$in": list(team_ids)}}, {"country": 1, "rating": 1})}
+    snapshot = {m["_id"]: snapshot_entry(m, teams) for m in matches}
+    for m in matches:
+        if m.get("winner") and not m.get("winnerName"):
+            snapshot[m["_id"]]["winnerName"] = teams.get(m["winner"], {}).get("country", m["winner"])
+    fields = {"snapshot": snapshot, "snapshotVersion": 0,
+              "matchesPlayed": sum(m["status"] == "simulated" for m in matches)}
+    await db.tournaments.update_one({"_id": tour["_id"], "snapshot": {"$exists": False}}, {"$set": fields})
+    return {**tour, **fields}
+
+def bracket_matches(tour: dict, ratings: Optional[Dict[str, float]] = None) -> List[dict]:
+    """
+    Snapshot entries in bracket order, with odds from the current match model.
+    ratings (teamId -> current rating) replace the snapshot's for unplayed matches;
+    played ones keep the ratings they were played at.
+    """
+    ratings = ratings or {}
+    matches = []
+    for mid in tour.get("bracket", []):
+        entry = tour["snapshot"].get(mid)
+        if entry:
+            entry = dict(entry)
+            if entry["status"] != "simulated":
+                entry["homeRating"] = ratings.get(entry["homeTeam"], entry["homeRating"])
+                entry["awayRating"] = ratings.get(entry["awayTeam"], entry["awayRating"])
+            attach_expected_win(entry)
+            matches.append(entry)
+    return matches
+
+async def transition_tournament(tour: dict, update: Dict[str, Any]) -> Optional[dict]:
+    """
+    Apply update only if the tournament is still at the version we read.
+    Returns the updated doc, or None if another writer got there first.
+    """
+    version_filter = tour["version"] if "version" in tour else {"$exists": False}
+    update = {**update, "$inc": {**update.get("$inc", {}), "version": 1}}
+    return await db.tournaments.find_one_and_update(
+        {"_id": tour["_id"], "version": version_filter},
+        update,
+        return_document=ReturnDocument.AFTER
+    )
 
+async def create_round_matches(tournament_id: str, round_name: str, team_ids: List[str]) -> List[dict]:
+    """
+    Insert a round's matches exactly once. A concurrent creator trips the unique
+    (tournamentId, round, slot) index, in which case the stored matches are returned.
+    The insert is unordered, so a slot the other creator hasn't written yet gets our
+    doc: once it returns every slot is filled, whoever filled it.
+    """
+    docs = pair_round_matches(tournament_id, round_name, team_ids)
+    try:
+        await db.matches.insert_many(docs, ordered=False)
+        return docs
+    except BulkWriteError:
+        stored = await db.matches.find(
+            {"tournamentId": tournament_id, "round": round_name}
+        ).sort("slot", 1).to_list(length=None)
+        if len(stored) != len(docs):
+            raise RuntimeError(f"{round_name} of {tournament_id}: {len(stored)} of {len(docs)} matches stored")
+        return stored
 
 # Helper: build quarter-final bracket when exactly 8 teams
 async def build_quarter_bracket():
@@ -774,36 +2386,19 @@ async def build_quarter_bracket():
     teams = sorted(teams, key=lambda x: x.get('createdAt'))[:8]
     random.shuffle(teams)
 
-    
-    tournament_doc = {
-        "_id": make_id("tournament"),
-        "status": "in_progress",
-        "bracket": [],
-        "teams": [t["_id"] for t in teams],
-        "createdAt": datetime.utcnow()
-    }
-    await db.tournaments.insert_one(tournament_doc)
-
-    matches = []
-    for i in range(0, 8, 2):
-        m_id = make_id("match")
-        match_doc = MatchInDB(
-            round="QuarterFinal",
-            homeTeam=teams[i]["_id"],
-            awayTeam=teams[i+1]["_id"]
-        ).dict()
-        match_doc["_id"] = m_id
-        match_doc["tournamentId"] = tournament_doc["_id"]  
-        await db.matches.insert_one(match_doc)
-        matches.append(m_id)
+    # previous finished seasons move to the archive before the new one starts
+    await archive_finished_tournaments()
 
-    
-    await db.tournaments.update_one(
-        {"_id": tournament_doc["_id"]},
-        {"$set": {"bracket": matches}}
-    )
+    tournament_id = make_id("tournament")
+    matches = pair_round_matches(tournament_id, "QuarterFinal", [t["_id"] for t in teams])
+    tournament_doc = new_tournament_doc(tournament_id, teams, matches)
 
-    tournament_doc = await db.tournaments.find_one({"_id": tournament_doc["_id"]})
+    # the unique "active" index lets only one concurrent start win
+    try:
+        await db.tournaments.insert_one(tournament_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="A tournament is already in progress")
+    await db.matches.insert_many(matches)
     return tournament_doc
 
 
@@ -819,65 +2414,44 @@ async def start_tournament(admin=Depends(admin_required)):
     tour = await build_quarter_bracket()
     return {"tournament": tour}
 
-@app.get("/tournament/bracket")
+@app.get("/tournament/bracket", dependencies=[Depends(public_rate_limit)])
+@cached("tournaments", "teams")
+@coalesced
 async def get_bracket():
-    tour = await db.tournaments.find_one({})
+    tour = await db.tournaments.find_one({}, sort=[("createdAt", -1)])
     if not tour:
         return {"message": "No tournament yet"}
 
-    matches = []
-    for mid in tour.get("bracket", []):
-        m = await db.matches.find_one({"_id": mid})
-        if m:
-            # Attach team docs
-            home_team = await db.teams.find_one({"_id": m["homeTeam"]})
-            away_team = await db.teams.find_one({"_id": m["awayTeam"]})
-
-            m["homeTeamName"] = home_team["country"] if home_team else m["homeTeam"]
-            m["awayTeamName"] = away_team["country"] if away_team else m["awayTeam"]
-            m["homeRating"]   = float(home_team.get("rating", 0)) if home_team else 0.0
-            m["awayRating"]   = float(away_team.get("rating", 0)) if away_team else 0.0
-
-            # Expected-win quick model (ratings are 0–100)
-            # logistic on rating diff; tweak divisor for sharpness
-            import math
-            diff = m["homeRating"] - m["awayRating"]
-            p_home = 1.0 / (1.0 + math.exp(-diff / 8.0))
-            m["expectedHomeWin"] = round(p_home * 100, 1)
-            m["expectedAwayWin"] = round((1 - p_home) * 100, 1)
-
-            if m.get("winner"):
-                winner_team = await db.teams.find_one({"_id": m["winner"]})
-                m["winnerName"] = winner_team["country"] if winner_team else m["winner"]
+    # names, scores and winners live in the snapshot; only the ratings of teams
+    # still to play are read live, since lineup changes move them
+    tour = await ensure_bracket_snapshot(tour)
+    matches = bracket_matches(tour, await pending_team_ratings(tour))
+    tour.pop("snapshot")
+    return MongoJSONResponse({"tournament": tour, "matches": matches})
 
-            matches.append(m)
 
-    return {"tournament": tour, "matches": matches}
 
-
-
-@app.get("/tournament/status")
+@app.get("/tournament/status", dependencies=[Depends(public_rate_limit)])
+@cached("tournaments")
+@coalesced
 async def tournament_status():
-    tournament = await db.tournaments.find_one({"status": {"$in": ["in_progress", "finished"]}})
+    tournament = await db.tournaments.find_one(
+        {"status": {"$in": ["in_progress", "finished"]}},
+        {"status": 1, "current_round": 1, "teams": 1, "winner": 1, "winnerName": 1, "matchesPlayed": 1, "bracket": 1},
+        sort=[("createdAt", -1)]
+    )
     if not tournament:
         raise HTTPException(status_code=404, detail="No active tournament")
-
-    matches = await db.matches.find({"tournamentId": tournament["_id"]}).to_list(None)
-
-    winner_id = tournament.get("winner")
-    winner_name = None
-    if winner_id:
-        team = await db.teams.find_one({"_id": winner_id})
-        if team:
-            winner_name = team.get("country")
+    if "matchesPlayed" not in tournament:
+        tournament = await ensure_bracket_snapshot(await db.tournaments.find_one({"_id": tournament["_id"]}))
 
     return {
         "status": tournament["status"],
         "current_round": tournament.get("current_round", "QuarterFinal"),
         "teams_remaining": len(tournament.get("teams", [])),
-        "matches_played": len([m for m in matches if m["status"] == "simulated"]),
-        "winner": winner_id,
-        "winner_name": winner_name
+        "matches_played": tournament["matchesPlayed"],
+        "winner": tournament.get("winner"),
+        "winner_name": tournament.get("winnerName")
     }
 
 
@@ -888,6 +2462,326 @@ def poisson_sample(lam: float) -> int:
     lam = max(0.01, lam)
     return int(np.random.poisson(lam))
 
+# Match model: each side scores Poisson(lambda), lambdas shift with the rating gap.
+# Level after 90' -> extra time at extraTimeFactor of the rate -> penalties biased by rating.
+MATCH_LAMBDA_MIN, MATCH_LAMBDA_MAX = 0.1, 4.0
+DEFAULT_TEAM_RATING = 50.0  # teams stored without a rating play (and are priced) as average
+
+@dataclass(slots=True, frozen=True)
+class MatchModel:
+    baseGoals: float = 1.2
+    ratingDivisor: float = 20.0
+    extraTimeFactor: float = 0.35
+    penaltyBiasDivisor: float = 200.0
+
+    def to_doc(self) -> Dict[str, float]:
+        return {
+            "baseGoals": self.baseGoals,
+            "ratingDivisor": self.ratingDivisor,
+            "extraTimeFactor": self.extraTimeFactor,
+            "penaltyBiasDivisor": self.penaltyBiasDivisor
+        }
+
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> "MatchModel":
+        defaults = cls().to_doc()
+        return cls(**{key: float(doc.get(key, value)) for key, value in defaults.items()})
+
+# the live model; calibration replaces it whole (set_match_model), never field by field
+match_model = MatchModel()
+
+def match_lambdas(r1, r2):
+    """Expected goals (home, away) for ratings r1 vs r2; works on floats and arrays."""
+    adv = (np.asarray(r1, dtype=float) - r2) / match_model.ratingDivisor
+    lam1 = np.clip(match_model.baseGoals + adv, MATCH_LAMBDA_MIN, MATCH_LAMBDA_MAX)
+    lam2 = np.clip(match_model.baseGoals - adv, MATCH_LAMBDA_MIN, MATCH_LAMBDA_MAX)
+    return lam1, lam2
+
+def penalty_home_prob(r1, r2):
+    """Chance the home side wins a shoot-out."""
+    return np.clip(0.5 + (np.asarray(r1, dtype=float) - r2) / match_model.penaltyBiasDivisor, 0.05, 0.95)
+
+def play_knockouts(r1: np.ndarray, r2: np.ndarray, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    """Vectorised simulate_match_logic scoring for many fixtures at once (no scorers, commentary or I/O)."""
+    lam1, lam2 = match_lambdas(r1, r2)
+    g1, g2 = rng.poisson(lam1), rng.poisson(lam2)
+    extra = g1 == g2
+    g1 = g1 + np.where(extra, rng.poisson(lam1 * match_model.extraTimeFactor), 0)
+    g2 = g2 + np.where(extra, rng.poisson(lam2 * match_model.extraTimeFactor), 0)
+    pens = extra & (g1 == g2)
+    home_win = np.where(pens, rng.random(g1.shape) < penalty_home_prob(r1, r2), g1 > g2)
+    return {"home": g1, "away": g2, "extra": extra, "pens": pens, "homeWin": home_win}
+
+
+# --- CPU offloading (process pool) ---
+# Heavy NumPy work (batch knockouts, calibration grids) runs in worker processes so the
+# event loop keeps serving requests. Tasks get plain arrays in and compact arrays out,
+# plus the current match model (workers never see calibration updates otherwise).
+# SIM_WORKERS=0 falls back to a thread.
+SIM_WORKERS = int(os.getenv("SIM_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+
+sim_pool: Optional[ProcessPoolExecutor] = None
+
+def get_sim_pool() -> ProcessPoolExecutor:
+    global sim_pool
+    if sim_pool is None:
+        # spawn, not fork: the parent has a running event loop and driver threads
+        sim_pool = ProcessPoolExecutor(max_workers=SIM_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return sim_pool
+
+def run_with_model(model: MatchModel, fn, *args):
+    """Worker-side entry: adopt the parent's match model, then run fn."""
+    global match_model
+    match_model = model
+    return fn(*args)
+
+async def run_cpu(fn, *args):
+    """Run a module-level, picklable fn(*args) off the event loop."""
+    if SIM_WORKERS <= 0:
+        return await asyncio.to_thread(fn, *args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_sim_pool(), run_with_model, match_model, fn, *args)
+
+# bracket columns of play_tournaments output: (round, slot) for each of the 7 matches
+BRACKET_COLUMNS = [(r, slot) for i, r in enumerate(TOURNAMENT_ROUNDS) for slot in range(4 >> i)]
+
+def play_tournaments(ratings: np.ndarray, n: int, seed) -> Dict[str, np.ndarray]:
+    """
+    n full 8-team knockouts, each with a fresh random draw. Returns (n, 7) arrays in
+    BRACKET_COLUMNS order: team indices into ratings, goals, extra/pens/homeWin flags,
+    plus the champion index per tournament.
+    """
+    rng = np.random.default_rng(seed)
+    # row i is the quarter-final draw of tournament i
+    alive = np.argsort(rng.random((n, 8)), axis=1)
+    cols = {key: [] for key in ("home", "away", "homeGoals", "awayGoals", "extra", "pens", "homeWin")}
+    for _ in TOURNAMENT_ROUNDS:
+        home, away = alive[:, 0::2], alive[:, 1::2]
+        res = play_knockouts(ratings[home], ratings[away], rng)
+        for key, value in (("home", home), ("away", away), ("homeGoals", res["home"]), ("awayGoals", res["away"]),
+                           ("extra", res["extra"]), ("pens", res["pens"]), ("homeWin", res["homeWin"])):
+            cols[key].append(value)
+        alive = np.where(res["homeWin"], home, away)
+
+    out = {key: np.concatenate(v, axis=1) for key, v in cols.items()}
+    for key in ("home", "away"):
+        out[key] = out[key].astype(np.int8)
+    for key in ("homeGoals", "awayGoals"):
+        out[key] = out[key].astype(np.int16)
+    out["champion"] = alive[:, 0].astype(np.int8)
+    return out
+
+
+# --- Match model: closed-form outcome probabilities + calibration ---
+MAX_GOALS = 20  # Poisson tails beyond this are < 1e-9 for lambda <= 4
+LOG_FACTORIAL = np.concatenate([[0.0], np.cumsum(np.log(np.arange(1, 64)))])
+CALIBRATION_MIN_MATCHES = 30
+CALIBRATION_GRID = 11  # points per parameter axis, per refinement pass
+
+def poisson_logpmf(k, lam):
+    k = np.asarray(k)
+    return k * np.log(lam) - lam - LOG_FACTORIAL[np.clip(k, 0, LOG_FACTORIAL.size - 1)]
+
+def scoreline_grids(lam1: np.ndarray, lam2: np.ndarray) -> np.ndarray:
+    """(N, MAX_GOALS+1, MAX_GOALS+1) joint score distributions, [n, home, away]."""
+    goals = np.arange(MAX_GOALS + 1)
+    p1 = np.exp(poisson_logpmf(goals, lam1[:, None]))
+    p2 = np.exp(poisson_logpmf(goals, lam2[:, None]))
+    return p1[:, :, None] * p2[:, None, :]
+
+# Every model output depends on the ratings only through their difference, so the
+# table has one row per ODDS_STEP of the gap home - away (ratings live in 0..100);
+# lookups interpolate between neighbouring rows.
+ODDS_STEP = 0.1
+ODDS_MAX_GAP = 100.0
+
+def build_odds_table() -> Dict[str, np.ndarray]:
+    """Closed-form outcome table for every rating gap, built in one vectorised pass."""
+    gaps = np.arange(-ODDS_MAX_GAP, ODDS_MAX_GAP + ODDS_STEP / 2, ODDS_STEP)
+    lam1, lam2 = match_lambdas(gaps, 0.0)
+    home_ahead = np.tril(np.ones((MAX_GOALS + 1, MAX_GOALS + 1), dtype=bool), -1)
+
+    regulation = scoreline_grids(lam1, lam2)
+    extra_time = scoreline_grids(lam1 * match_model.extraTimeFactor, lam2 * match_model.extraTimeFactor)
+    win90, level90 = regulation[:, home_ahead].sum(axis=1), np.trace(regulation, axis1=1, axis2=2)
+    loss90 = 1.0 - win90 - level90
+    win_et, level_et = extra_time[:, home_ahead].sum(axis=1), np.trace(extra_time, axis1=1, axis2=2)
+    pens = level90 * level_et
+    home = win90 + level90 * win_et + pens * penalty_home_prob(gaps, 0.0)
+    return {
+        "lambdas": np.stack([lam1, lam2], axis=1),
+        "regulation": regulation,   # P(score after 90')
+        "extraTime": extra_time,    # P(extra-time goals), given level after 90'
+        "outcomes": np.stack([home, 1.0 - home, win90, level90, loss90, level90 * win_et, pens], axis=1),
+    }
+
+ODDS_OUTCOMES = ("home", "away", "homeWin90", "draw90", "awayWin90", "homeWinExtraTime", "penalties")
+
+def odds_lookup(key: str, r1: float, r2: float) -> np.ndarray:
+    """odds_table[key] at the gap r1 - r2, linear between the two nearest rows."""
+    table = odds_table[key]
+    gap = min(ODDS_MAX_GAP, max(-ODDS_MAX_GAP, float(r1) - float(r2)))
+    pos = (gap + ODDS_MAX_GAP) / ODDS_STEP
+    i = min(int(pos), len(table) - 2)
+    w = pos - i
+    return table[i] * (1.0 - w) + table[i + 1] * w
+
+def match_outcome_probs(r1: float, r2: float) -> Dict[str, float]:
+    """
+    Chance each side goes through under simulate_match_logic's model
+    (90' -> extra time -> penalties), interpolated from the precomputed odds table
+    (within ~1e-5 of the closed form).
+    """
+    row = odds_lookup("outcomes", r1, r2)
+    return dict(zip(ODDS_OUTCOMES, row.tolist()))
+
+def attach_expected_win(m: dict):
+    p_home = match_outcome_probs(m["homeRating"], m["awayRating"])["home"]
+    m["expectedHomeWin"] = round(p_home * 100, 1)
+    m["expectedAwayWin"] = round((1 - p_home) * 100, 1)
+
+def set_match_model(model: MatchModel):
+    global match_model, odds_table
+    match_model = model
+    odds_table = build_odds_table()
+
+odds_table = build_odds_table()
+
+def match_loglik(base, divisor, factor, data: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Log-likelihood of the observed scores (penalty winners excluded) under the
+    model. base/divisor/factor may be same-shaped grids of candidate values.
+    Extra-time scores are summed over every possible level regulation score.
+    """
+    base, divisor = np.asarray(base, dtype=float)[..., None], np.asarray(divisor, dtype=float)[..., None]
+    factor = np.asarray(factor, dtype=float)[..., None, None]
+    adv = (data["r1"] - data["r2"]) / divisor
+    lam1 = np.clip(base + adv, MATCH_LAMBDA_MIN, MATCH_LAMBDA_MAX)
+    lam2 = np.clip(base - adv, MATCH_LAMBDA_MIN, MATCH_LAMBDA_MAX)
+    g1, g2, extra = data["g1"], data["g2"], data["extra"]
+
+    regular = poisson_logpmf(g1, lam1) + poisson_logpmf(g2, lam2)
+    total = np.where(extra, 0.0, regular).sum(axis=-1)
+    if not extra.any():
+        return total
+
+    l1, l2 = lam1[..., extra, None], lam2[..., extra, None]
+    e1, e2 = g1[extra, None], g2[extra, None]
+    t = np.arange(int(np.minimum(e1, e2).max()) + 1)
+    valid = t <= np.minimum(e1, e2)
+    terms = (poisson_logpmf(t, l1) + poisson_logpmf(t, l2)
+             + poisson_logpmf(e1 - t, factor * l1) + poisson_logpmf(e2 - t, factor * l2))
+    terms = np.where(valid, terms, -np.inf)
+    peak = terms.max(axis=-1, keepdims=True)
+    return total + (peak[..., 0] + np.log(np.exp(terms - peak).sum(axis=-1))).sum(axis=-1)
+
+def penalty_loglik(divisor, data: Dict[str, np.ndarray]) -> np.ndarray:
+    divisor = np.asarray(divisor, dtype=float)[..., None]
+    p = np.clip(0.5 + (data["pen_r1"] - data["pen_r2"]) / divisor, 0.05, 0.95)
+    return np.log(np.where(data["pen_home_won"], p, 1 - p)).sum(axis=-1)
+
+def played_ratings(match: dict, snapshot: Dict[str, dict]) -> Optional[Tuple[float, float]]:
+    """(home, away) ratings the match was played at: stored on the match, else its snapshot entry."""
+    for source in (match, snapshot.get(match["_id"], {})):
+        if source.get("homeRating") is not None and source.get("awayRating") is not None:
+            return float(source["homeRating"]), float(source["awayRating"])
+    return None
+
+async def calibration_data() -> Dict[str, np.ndarray]:
+    """
+    Simulated matches (live + archived) as arrays, rated with the ratings they were
+    played at. Matches with no record of those are left out: today's team ratings
+    may be on another scale (e.g. from before best-XI ratings) and would skew the fit.
+    """
+    played, snapshot = [], {}
+    async for tour in db.tournaments.find({"snapshot": {"$exists": True}}, {"snapshot": 1}):
+        snapshot.update(tour["snapshot"])
+    async for m in db.matches.find({"status": "simulated"}):
+        played.append((m, played_ratings(m, snapshot)))
+    async for season in db.season_archive.find({}, {"matches": 1, "tournament.snapshot": 1}):
+        season_snapshot = season.get("tournament", {}).get("snapshot", {})
+        played.extend((m, played_ratings(m, season_snapshot))
+                      for m in season.get("matches", []) if m.get("status") == "simulated")
+    played = [(m, r) for m, r in played if r is not None]
+    matches = [m for m, _ in played]
+
+    r1 = np.array([r[0] for _, r in played], dtype=float)
+    r2 = np.array([r[1] for _, r in played], dtype=float)
+    pens = np.array([bool(m.get("penalty_result")) for m in matches], dtype=bool)
+    home_won = np.array([m.get("winner") == m["homeTeam"] for m in matches], dtype=bool)
+    return {
+        "r1": r1,
+        "r2": r2,
+        "g1": np.array([m["score"]["home"] for m in matches], dtype=np.int64),
+        "g2": np.array([m["score"]["away"] for m in matches], dtype=np.int64),
+        # matches from before wentExtra was stored: only shoot-outs are known to have gone long
+        "extra": np.array([m.get("wentExtra", bool(m.get("penalty_result"))) for m in matches], dtype=bool),
+        "pen_r1": r1[pens],
+        "pen_r2": r2[pens],
+        "pen_home_won": home_won[pens],
+    }
+
+async def calibrate() -> Tuple[MatchModel, Dict[str, Any]]:
+    """Grid-search maximum-likelihood fit of the match model to every stored result."""
+    data = await calibration_data()
+    if data["r1"].size < CALIBRATION_MIN_MATCHES:
+        raise HTTPException(status_code=400, detail=f"Need at least {CALIBRATION_MIN_MATCHES} simulated matches")
+
+    current = match_model
+    fitted, scores = await run_cpu(fit_match_model, data)
+    return fitted, {
+        "matches": int(data["r1"].size),
+        "shootouts": int(data["pen_r1"].size),
+        "current": current.to_doc(),
+        "fitted": fitted.to_doc(),
+        "logLikelihood": scores,
+    }
+
+@app.get("/admin/calibrate")
+async def calibrate_match_model(admin=Depends(admin_required)):
+    """Fit only; the simulator keeps its current model."""
+    _, report = await calibrate()
+    return {**report, "applied": False}
+
+@app.post("/admin/calibrate/apply")
+async def apply_match_model_calibration(admin=Depends(admin_required)):
+    """Refit, store the fit (settings.match_model) and switch the simulator to it."""
+    fitted, report = await calibrate()
+    await db.settings.replace_one({"_id": "match_model"}, fitted.to_doc(), upsert=True)
+    set_match_model(fitted)
+    return {**report, "applied": True}
+
+def fit_match_model(data: Dict[str, np.ndarray]) -> Tuple[MatchModel, Dict[str, float]]:
+    """Returns (fitted model, {"current": loglik, "fitted": loglik}). CPU-bound; run via run_cpu."""
+    # coarse grid over (base, log divisor, factor), then a finer one around the best cell
+    lo, hi = np.array([0.6, np.log(5.0), 0.1]), np.array([2.4, np.log(100.0), 1.0])
+    for points in (CALIBRATION_GRID, CALIBRATION_GRID):
+        axes = [np.linspace(a, b, points) for a, b in zip(lo, hi)]
+        base, log_div, factor = np.meshgrid(*axes, indexing="ij")
+        surface = match_loglik(base, np.exp(log_div), factor, data)
+        best = np.array([base, log_div, factor])[(slice(None), *np.unravel_index(np.argmax(surface), surface.shape))]
+        step = (hi - lo) / (points - 1)
+        lo, hi = best - step, best + step
+
+    penalty_divisor = match_model.penaltyBiasDivisor
+    if data["pen_r1"].size:
+        pen_divisors = np.geomspace(50.0, 2000.0, 40)
+        penalty_divisor = round(float(pen_divisors[np.argmax(penalty_loglik(pen_divisors, data))]), 1)
+    fitted = MatchModel(
+        baseGoals=round(float(best[0]), 3),
+        ratingDivisor=round(float(np.exp(best[1])), 2),
+        extraTimeFactor=round(float(best[2]), 3),
+        penaltyBiasDivisor=penalty_divisor
+    )
+
+    def loglik(m: MatchModel):
+        score = float(match_loglik(m.baseGoals, m.ratingDivisor, m.extraTimeFactor, data))
+        if data["pen_r1"].size:
+            score += float(penalty_loglik(m.penaltyBiasDivisor, data))
+        return round(score, 2)
+
+    return fitted, {"current": loglik(match_model), "fitted": loglik(fitted)}
+
 async def assign_goal_scorers(team_id: str, num_goals: int) -> List[Dict[str, Any]]:
     if num_goals <= 0:
         return []
@@ -919,28 +2813,60 @@ async def assign_goal_scorers(team_id: str, num_goals: int) -> List[Dict[str, An
     events.sort(key=lambda x: x["minute"])
     return events
 
-# AI generation with line-by-line processing
-async def generate_ai_commentary(home, away, events, went_extra, penalty_result, winner_name):
-    # Build a simple summary of key events
-    goals_summary = []
-    for ev in events:
-        player = await db.players.find_one({"_id": ev["playerId"]})
-        if player:
-            team_name = home["country"] if ev["teamId"] == home["_id"] else away["country"]
-            goals_summary.append(f"{ev['minute']}' - {player['name']} ({team_name})")
+# --- Commentary engines ---
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/api/generate")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma:2b")
+COMMENTARY_LLM_MAX_INFLIGHT = int(os.getenv("COMMENTARY_LLM_MAX_INFLIGHT", "2"))
+COMMENTARY_LATENCY_BUDGET = float(os.getenv("COMMENTARY_LATENCY_BUDGET", "20"))  # seconds per LLM call
+COMMENTARY_LLM_BACKOFF = 60.0  # seconds "auto" traffic avoids the LLM after a failure
+
+@dataclass(slots=True)
+class GoalLine:
+    minute: int
+    playerName: str
+    teamName: str
+    isHome: bool
+
+@dataclass(slots=True)
+class CommentaryContext:
+    seed: str            # match id; keeps template commentary stable per match
+    homeName: str
+    awayName: str
+    goals: List[GoalLine]
+    wentExtra: bool
+    penalties: bool
+    winnerName: str
+
+    def goals_summary(self) -> List[str]:
+        return [f"{g.minute}' - {g.playerName} ({g.teamName})" for g in self.goals]
+
+async def build_commentary_context(match_id: str, home: dict, away: dict, events: List[Dict[str, Any]],
+                                   went_extra: bool, penalty_result, winner_name: str) -> CommentaryContext:
+    # one $in lookup for all scorers instead of a find_one per goal
+    ids = list({ev["playerId"] for ev in events})
+    names = {p["_id"]: p["name"] async for p in db.players.find({"_id": {"$in": ids}}, {"name": 1})}
+    goals = [
+        GoalLine(ev["minute"], names[ev["playerId"]],
+                 home["country"] if ev["teamId"] == home["_id"] else away["country"],
+                 ev["teamId"] == home["_id"])
+        for ev in events if ev["playerId"] in names
+    ]
+    return CommentaryContext(match_id, home["country"], away["country"], goals,
+                             bool(went_extra), bool(penalty_result), winner_name)
 
-    # Create the commentary prompt
-    prompt = f"""
+def build_commentary_prompt(ctx: CommentaryContext) -> str:
+    goals_summary = ctx.goals_summary()
+    return f"""
     You are a lively football commentator.
     Generate exciting commentary for a knockout match:
-    {home['country']} vs {away['country']}.
+    {ctx.homeName} vs {ctx.awayName}.
 
     Goals:
     {chr(10).join(goals_summary) if goals_summary else "No goals yet"}
 
-    Extra time: {"Yes" if went_extra else "No"}
-    Penalties: {"Yes" if penalty_result else "No"}
-    Winner: {winner_name}
+    Extra time: {"Yes" if ctx.wentExtra else "No"}
+    Penalties: {"Yes" if ctx.penalties else "No"}
+    Winner: {ctx.winnerName}
 
     Rules:
     - Start with kickoff
@@ -950,117 +2876,563 @@ async def generate_ai_commentary(home, away, events, went_extra, penalty_result,
     - Keep it 8–12 sentences, short and punchy
     """
 
-    try:
+COMMENTARY_MIN_SENTENCES = 8
+COMMENTARY_MAX_SENTENCES = 12
+
+class CommentaryBackend(abc.ABC):
+    """Turns a CommentaryContext into a list of commentary sentences."""
+    name = "base"
+
+    @abc.abstractmethod
+    async def generate(self, ctx: CommentaryContext) -> List[str]:
+        ...
+
+class TemplateCommentary(CommentaryBackend):
+    """
+    Deterministic phrase-bank commentary: 8–12 sentences in chronological order,
+    seeded by the match id. No I/O, so it is safe for bulk simulation.
+    """
+    name = "template"
+
+    KICKOFF = [
+        "The referee blows and we are underway between {home} and {away}!",
+        "Kickoff! {home} and {away} get this knockout tie started.",
+        "A packed stadium roars as {home} kick off against {away}.",
+    ]
+    FILLER = [
+        "{team} string together a patient spell of possession.",
+        "A clever through ball from {team} is cut out just in time.",
+        "Close! A curling effort from {team} flashes just wide of the post.",
+        "The crowd rises as {team} win a corner.",
+        "A crunching tackle in midfield and the referee reaches for a yellow card.",
+        "{team} are pressing high now, forcing mistakes at the back.",
+        "The keeper gets down well to smother a low drive from {team}.",
+        "Tension is building; neither side wants to give an inch.",
+        "{team} hit the woodwork! So nearly a goal.",
+        "The drums are beating and the fans are in full voice.",
+    ]
+    GOAL = [
+        "GOAL! {player} scores for {team} after {minute} minutes! {score}.",
+        "{minute}' - {player} finds the net for {team}! It's {score}.",
+        "What a finish from {player}! {team} strike on {minute} minutes, {score}.",
+        "{player} makes no mistake from close range - {team} score, {score}!",
+    ]
+    EXTRA_TIME = [
+        "Level after ninety minutes, so we head into extra time.",
+        "Nothing to separate them in normal time - thirty more minutes to play!",
+    ]
+    PENALTIES = [
+        "Still level after extra time - this will be decided by penalties!",
+        "It goes to a penalty shootout, nerves of steel required.",
+    ]
+    FULL_TIME = [
+        "The final whistle blows - {winner} go through!",
+        "It's all over! {winner} win this knockout tie.",
+        "Full time, and {winner} celebrate in front of their fans!",
+    ]
+
+    def sentences(self, ctx: CommentaryContext) -> List[str]:
+        rng = random.Random(ctx.seed)
+        fmt = {"home": ctx.homeName, "away": ctx.awayName, "winner": ctx.winnerName}
+        lines = [rng.choice(self.KICKOFF).format(**fmt)]
+
+        goal_lines, home_goals, away_goals = [], 0, 0
+        for g in ctx.goals:
+            home_goals += g.isHome
+            away_goals += not g.isHome
+            score = f"{ctx.homeName} {home_goals}-{away_goals} {ctx.awayName}"
+            goal_lines.append(rng.choice(self.GOAL).format(
+                player=g.playerName, team=g.teamName, minute=g.minute, score=score))
+
+        closing = []
+        if ctx.wentExtra:
+            closing.append(rng.choice(self.EXTRA_TIME))
+        if ctx.penalties:
+            closing.append(rng.choice(self.PENALTIES))
+        closing.append(rng.choice(self.FULL_TIME).format(**fmt))
+
+        # a goal-fest can't fit: keep the first goals and the last one (final score);
+        # kickoff and the result/winner lines always stay
+        room = COMMENTARY_MAX_SENTENCES - 1 - len(closing)
+        if len(goal_lines) > room:
+            goal_lines = goal_lines[:room - 1] + goal_lines[-1:]
+
+        # pad with atmosphere/near misses between the goals to reach 8–12 sentences
+        target = rng.randint(COMMENTARY_MIN_SENTENCES, COMMENTARY_MAX_SENTENCES)
+        n_filler = max(0, target - 1 - len(goal_lines) - len(closing))
+        fillers = [rng.choice(self.FILLER).format(team=rng.choice([ctx.homeName, ctx.awayName]))
+                   for _ in range(n_filler)]
+        slots = sorted(rng.randint(0, len(goal_lines)) for _ in fillers)
+        middle = []
+        for i, goal_line in enumerate(goal_lines + [None]):
+            middle.extend(f for f, slot in zip(fillers, slots) if slot == i)
+            if goal_line is not None:
+                middle.append(goal_line)
+        return lines + middle + closing
+
+    async def generate(self, ctx: CommentaryContext) -> List[str]:
+        return self.sentences(ctx)
+
+class SentenceSegmenter:
+    """
+    Incremental sentence splitter for streamed LLM text.
+    feed() returns the sentences completed by a chunk; each character is scanned
+    once. A terminator only ends a sentence when followed by whitespace, so
+    decimals ("2.5"), abbreviations ("vs.", "Dr.") and initials ("J. Smith") stay
+    intact, and a terminator at the end of a chunk waits for the next one.
+    """
+    BOUNDARY = re.compile(r"[.!?]")
+    TRAILING = ".!?\"')]\u201d\u2019"
+    ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "st", "vs", "v", "jr", "sr", "no", "mt", "etc", "e.g", "i.e", "approx"}
+
+    def __init__(self):
+        self._parts: List[str] = []  # text of the unfinished sentence
+        self._size = 0
+        self._scan = 0  # offset into the unfinished sentence still to examine
+
+    def _is_abbreviation(self, buf: str, end: int) -> bool:
+        start = end
+        while start > 0 and (buf[start - 1].isalpha() or buf[start - 1] == "."):
+            start -= 1
+        word = buf[start:end]
+        return word.lower() in self.ABBREVIATIONS or (len(word) == 1 and word.isupper())
+
+    def feed(self, text: str) -> List[str]:
+        if self._scan == self._size and not self.BOUNDARY.search(text):
+            # nothing to decide yet: just keep the chunk (no re-joining per chunk)
+            self._parts.append(text)
+            self._size += len(text)
+            self._scan = self._size
+            return []
+
+        buf = "".join(self._parts) + text
+        sentences, start, i = [], 0, self._scan
+        while (m := self.BOUNDARY.search(buf, i)):
+            j = m.end()
+            while j < len(buf) and buf[j] in self.TRAILING:
+                j += 1
+            if j == len(buf):
+                i = m.start()  # need the next character to decide
+                break
+            if not buf[j].isspace() or (m.group() == "." and self._is_abbreviation(buf, m.start())):
+                i = j
+                continue
+            sentence = buf[start:j].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = i = j
+        else:
+            i = len(buf)
+        self._parts = [buf[start:]]
+        self._size = len(buf) - start
+        self._scan = i - start
+        return sentences
+
+    def flush(self) -> List[str]:
+        rest = "".join(self._parts).strip()
+        self._parts, self._size, self._scan = [], 0, 0
+        return [rest] if rest else []
+
+class OllamaCommentary(CommentaryBackend):
+    """Local LLM via Ollama's streaming /api/generate."""
+    name = "llm"
+
+    async def stream(self, ctx: CommentaryContext) -> AsyncIterator[str]:
+        """Yield sentences as soon as the model completes them."""
+        segmenter = SentenceSegmenter()
         async with httpx.AsyncClient(timeout=60.0) as client:
             async with client.stream(
                 "POST",
-                "http://localhost:11434/api/generate",
+                OLLAMA_URL,
                 json={
-                    "model": "gemma:2b",
-                    "prompt": prompt,
+                    "model": OLLAMA_MODEL,
+                    "prompt": build_commentary_prompt(ctx),
                     "options": {"temperature": 0.7, "num_predict": 300}
                 }
             ) as resp:
-                commentary_text = ""
                 async for line in resp.aiter_lines():
                     if not line.strip():
                         continue
                     try:
                         data = json.loads(line)
-                        if "response" in data:
-                            commentary_text += data["response"]
-                    except Exception:
+                    except ValueError:
                         continue
+                    for sentence in segmenter.feed(data.get("response", "")):
+                        yield sentence
+        for sentence in segmenter.flush():
+            yield sentence
+
+    async def generate(self, ctx: CommentaryContext) -> List[str]:
+        sentences = [s async for s in self.stream(ctx)]
+        if not sentences:
+            raise RuntimeError("LLM returned no commentary")
+        return sentences
+
+class CommentaryScheduler:
+    """
+    Picks a backend per match:
+    - mode="bulk" always uses the template engine
+    - mode="featured" uses the LLM whenever an LLM slot (max_inflight) is free
+    - mode="auto" also needs the expected wait (recent latency x queue depth) to fit
+      the latency budget, and no LLM failure in the last COMMENTARY_LLM_BACKOFF seconds
+    Any LLM failure or timeout falls back to the template engine.
+    """
 
-        if commentary_text.strip():
-            sentences = [s.strip() for s in commentary_text.split(".") if s.strip()]
-            return [s + "." for s in sentences]
+    def __init__(self, llm: CommentaryBackend, template: CommentaryBackend,
+                 max_inflight: int, latency_budget: float):
+        self.llm = llm
+        self.template = template
+        self.max_inflight = max_inflight
+        self.latency_budget = latency_budget
+        self.inflight = 0
+        self.avg_latency = 0.0  # EWMA of successful LLM calls, seconds
+        self.backoff_until = 0.0
+
+    def pick(self, mode: str) -> CommentaryBackend:
+        if mode == "bulk" or self.inflight >= self.max_inflight:
+            return self.template
+        if mode == "featured":
+            return self.llm
+        if asyncio.get_running_loop().time() < self.backoff_until:
+            return self.template
+        if self.avg_latency * (self.inflight + 1) > self.latency_budget:
+            return self.template
+        return self.llm
+
+    async def generate(self, ctx: CommentaryContext, mode: str = "auto") -> List[str]:
+        backend = self.pick(mode)
+        if backend is self.template:
+            return await self.template.generate(ctx)
+
+        self.inflight += 1
+        started = asyncio.get_running_loop().time()
+        try:
+            lines = await asyncio.wait_for(backend.generate(ctx), timeout=self.latency_budget)
+            elapsed = asyncio.get_running_loop().time() - started
+            self.avg_latency = elapsed if not self.avg_latency else 0.8 * self.avg_latency + 0.2 * elapsed
+            return lines
+        except Exception as e:
+            self.backoff_until = asyncio.get_running_loop().time() + COMMENTARY_LLM_BACKOFF
+            print("LLM commentary failed, using template:", e)
+            return await self.template.generate(ctx)
+        finally:
+            self.inflight -= 1
+
+commentary_scheduler = CommentaryScheduler(
+    OllamaCommentary(), TemplateCommentary(), COMMENTARY_LLM_MAX_INFLIGHT, COMMENTARY_LATENCY_BUDGET
+)
 
-    except Exception as e:
-        print("Ollama failed, using fallback:", e)
 
-    # fallback
-    commentary = [f"Kickoff between {home['country']} and {away['country']}!"]
-    commentary.extend(goals_summary)
-    commentary.append(f"Final whistle. Winner: {winner_name}")
-    return commentary
+# --- Helper: automatically progress the tournament when a round finishes ---
+async def advance_tournament_round(tournament_id: str) -> Optional[dict]:
+    """
+    If every match of the current round is simulated, move the tournament to the
+    next round (creating its matches) or finish it after the Final.
+    Idempotent and safe to call concurrently; returns the latest tournament doc.
+    """
+    for _ in range(TRANSITION_RETRIES):
+        tournament = await db.tournaments.find_one({"_id": tournament_id})
+        if not tournament or tournament.get("status") != "in_progress":
+            return tournament
+
+        current_round = tournament.get("current_round", TOURNAMENT_ROUNDS[0])
+        current_matches = await db.matches.find({
+            "tournamentId": tournament_id,
+            "round": current_round
+        }).sort("slot", 1).to_list(None)
+
+        # a worker that died between a result and its snapshot copy left the bracket behind
+        # (or before the rest of its side effects)
+        snapshot = tournament.get("snapshot", {})
+        for m in current_matches:
+            if m["status"] != "simulated":
+                continue
+            if m.get("sideEffectsApplied") is False:
+                await apply_match_effects(m)
+            elif m["_id"] in snapshot and snapshot[m["_id"]]["status"] != "simulated":
+                await record_snapshot_result(tournament_id, m["_id"], m)
+
+        # Only proceed if all matches are simulated
+        if not current_matches or any(m["status"] != "simulated" for m in current_matches):
+            return tournament
+
+        current_index = TOURNAMENT_ROUNDS.index(current_round)
+        if current_index + 1 < len(TOURNAMENT_ROUNDS):
+            next_round = TOURNAMENT_ROUNDS[current_index + 1]
+            winners = [m["winner"] for m in current_matches if m.get("winner")]
+            new_matches = await create_round_matches(tournament_id, next_round, winners)
+            update = {
+                "$set": {"current_round": next_round},
+                "$addToSet": {"bracket": {"$each": [m["_id"] for m in new_matches]}}
+            }
+            if "snapshot" in tournament:
+                info = snapshot_team_info(tournament["snapshot"])
+                update["$set"].update({f"snapshot.{m['_id']}": snapshot_entry(m, info) for m in new_matches})
+                update["$inc"] = {"snapshotVersion": 1}
+        else:
+            # Tournament is finished after final
+            final_match = current_matches[0]
+            update = {
+                "$set": {"status": "finished", "winner": final_match["winner"],
+                         "winnerName": final_match.get("winnerName")},
+                "$unset": {"active": ""}
+            }
+
+        updated = await transition_tournament(tournament, update)
+        if updated:
+            print(f"✅ Tournament {tournament_id}: {current_round} complete ->",
+                  updated.get("current_round") if updated["status"] == "in_progress" else "finished")
+            return updated
+        # lost the race (version moved): re-read and re-check
 
+    return await db.tournaments.find_one({"_id": tournament_id})
 
-# --- Helper: automatically progress the tournament when a round finishes ---
-async def advance_tournament_round(tournament_id: str):
-    tournament = await db.tournaments.find_one({"_id": tournament_id})
-    if not tournament:
-        return
 
-    round_order = ["QuarterFinal", "SemiFinal", "Final"]
-    current_round = tournament.get("current_round", "QuarterFinal")
-    current_index = round_order.index(current_round)
-
-    # Fetch all matches for this round
-    current_matches = await db.matches.find({
-        "tournamentId": tournament_id,
-        "round": current_round
-    }).to_list(None)
-
-    # Only proceed if all matches are simulated
-    if all(m["status"] == "simulated" for m in current_matches):
-        winners = [m["winner"] for m in current_matches if m.get("winner")]
-
-        if current_index + 1 < len(round_order):
-            next_round = round_order[current_index + 1]
-            # check if next round matches already exist for this tournament
-            existing_next = await db.matches.count_documents({
-                "tournamentId": tournament_id,
-                "round": next_round
-            })
-            if existing_next > 0:
-                print(f"Skipping creation of {next_round}, already exists.")
-                return
+# --- Team stats rollups (maintained per simulated match, read in O(1)) ---
+FORM_LENGTH = 10  # recent results kept per team / per head-to-head pair
 
-            new_matches = []
-
-            for i in range(0, len(winners), 2):
-                if i + 1 < len(winners):
-                    new_match = MatchInDB(
-                        round=next_round,
-                        homeTeam=winners[i],
-                        awayTeam=winners[i + 1]
-                    ).dict()
-                    new_match["_id"] = make_id("match")
-                    new_match["tournamentId"] = tournament_id
-                    new_matches.append(new_match)
-
-            if new_matches:
-                await db.matches.insert_many(new_matches)
-                await db.tournaments.update_one(
-                    {"_id": tournament_id},
-                    {
-                        "$set": {"current_round": next_round},
-                        "$push": {"bracket": {"$each": [m["_id"] for m in new_matches]}}
-                    }
-                )
-                print(f"✅ Advanced to {next_round}")
-        else:
-            # Tournament is finished after final
-            final_match = await db.matches.find_one({
-                "round": "Final",
-                "tournamentId": tournament_id
-            })
-            if final_match:
-                await db.tournaments.update_one(
-                    {"_id": tournament_id},
-                    {"$set": {"status": "finished", "winner": final_match["winner"]}}
-                )
-                print("🏁 Tournament finished!")
+def head_to_head_id(team_a: str, team_b: str) -> str:
+    return ":".join(sorted([team_a, team_b]))
+
+def match_rollup_ops(match: dict, once: bool = False) -> tuple:
+    """
+    Build the team_stats and head_to_head upserts for one simulated match.
+    `match` needs homeTeam, awayTeam, round, score, winner and optionally
+    wentExtra / penalty_result / playedAt. once=True skips rollups whose recent
+    list already has the match; their upsert then collides on _id instead.
+    """
+    guard = {"recent.matchId": {"$ne": match["_id"]}} if once else {}
+    home_id, away_id = match["homeTeam"], match["awayTeam"]
+    g1, g2 = match["score"]["home"], match["score"]["away"]
+    winner_id, round_name = match["winner"], match["round"]
+    played_at = match.get("playedAt")
+
+    team_ops = []
+    for team_id, opponent_id, gf, ga in ((home_id, away_id, g1, g2), (away_id, home_id, g2, g1)):
+        result = "wins" if team_id == winner_id else "losses"
+        team_ops.append(UpdateOne({"_id": team_id, **guard}, {
+            "$inc": {
+                "played": 1,
+                result: 1,
+                "goalsFor": gf,
+                "goalsAgainst": ga,
+                "extraTime": int(bool(match.get("wentExtra"))),
+                "penalties": int(bool(match.get("penalty_result"))),
+                f"byRound.{round_name}.played": 1,
+                f"byRound.{round_name}.{result}": 1
+            },
+            "$push": {"recent": {"$each": [{
+                "matchId": match["_id"],
+                "round": round_name,
+                "opponent": opponent_id,
+                "result": "W" if result == "wins" else "L",
+                "score": f"{gf}-{ga}",
+                "playedAt": played_at
+            }], "$slice": -FORM_LENGTH}}
+        }, upsert=True))
+
+    h2h_op = UpdateOne({"_id": head_to_head_id(home_id, away_id), **guard}, {
+        "$set": {"teams": sorted([home_id, away_id])},
+        "$inc": {"played": 1, f"wins.{winner_id}": 1, f"goals.{home_id}": g1, f"goals.{away_id}": g2},
+        "$push": {"recent": {"$each": [{
+            "matchId": match["_id"],
+            "round": round_name,
+            "homeTeam": home_id,
+            "awayTeam": away_id,
+            "score": f"{g1}-{g2}",
+            "winner": winner_id,
+            "playedAt": played_at
+        }], "$slice": -FORM_LENGTH}}
+    }, upsert=True)
+    return team_ops, h2h_op
+
+async def record_match_rollups(match: dict):
+    """Safe to repeat for the same match (see apply_match_effects)."""
+    team_ops, h2h_op = match_rollup_ops(match, once=True)
+    for ops, collection in ((team_ops, db.team_stats), ([h2h_op], db.head_to_head)):
+        try:
+            await collection.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            ignore_duplicates(e)
+
+@app.get("/teams/{team_id}/stats/full")
+async def get_team_full_stats(team_id: str, form: int = Query(5, ge=1, le=FORM_LENGTH)):
+    team = await db.teams.find_one({"_id": team_id}, {"country": 1, "teamName": 1})
+    if not team:
+        raise HTTPException(status_code=404, detail="Team not found")
+    stats = await db.team_stats.find_one({"_id": team_id}) or {}
+
+    played = stats.get("played", 0)
+    goals_for, goals_against = stats.get("goalsFor", 0), stats.get("goalsAgainst", 0)
+    recent = stats.get("recent", [])[-form:]
+    return {
+        "teamId": team_id,
+        "country": team.get("country"),
+        "teamName": team.get("teamName"),
+        "played": played,
+        "wins": stats.get("wins", 0),
+        "losses": stats.get("losses", 0),
+        "goalsFor": goals_for,
+        "goalsAgainst": goals_against,
+        "averageMargin": round((goals_for - goals_against) / played, 2) if played else 0.0,
+        "extraTime": stats.get("extraTime", 0),
+        "penalties": stats.get("penalties", 0),
+        "byRound": stats.get("byRound", {}),
+        "form": "".join(r["result"] for r in recent),
+        "recent": recent
+    }
+
+@app.get("/stats/head_to_head")
+async def get_head_to_head(a: str, b: str):
+    h2h = await db.head_to_head.find_one({"_id": head_to_head_id(a, b)}) or {}
+    played = h2h.get("played", 0)
+    goals = h2h.get("goals", {})
+    wins = h2h.get("wins", {})
+    return {
+        "teams": [a, b],
+        "played": played,
+        "wins": {a: wins.get(a, 0), b: wins.get(b, 0)},
+        "goals": {a: goals.get(a, 0), b: goals.get(b, 0)},
+        "averageMargin": round((goals.get(a, 0) - goals.get(b, 0)) / played, 2) if played else 0.0,
+        "recent": h2h.get("recent", [])
+    }
+
+@app.post("/admin/rebuild_team_stats")
+async def rebuild_team_stats(admin=Depends(admin_required)):
+    """
+    Recompute team_stats and head_to_head from every simulated match (live + archived).
+    Only needed once for data that predates the rollups.
+    """
+    matches = await db.matches.find({"status": "simulated"}).to_list(length=None)
+    async for season in db.season_archive.find({}, {"matches": 1}):
+        matches.extend(m for m in season.get("matches", []) if m.get("status") == "simulated")
+    matches.sort(key=lambda m: m.get("playedAt") or datetime.min)
+
+    team_ops, h2h_ops = [], []
+    for m in matches:
+        t_ops, h_op = match_rollup_ops(m)
+        team_ops.extend(t_ops)
+        h2h_ops.append(h_op)
+
+    await db.team_stats.delete_many({})
+    await db.head_to_head.delete_many({})
+    if team_ops:
+        await db.team_stats.bulk_write(team_ops)
+        await db.head_to_head.bulk_write(h2h_ops)
+    return {"message": "Team stats rebuilt", "matches": len(matches)}
 
 
 # --- Core match simulation logic (no token check) ---
-async def simulate_match_logic(match_id: str) -> dict:
-    match = await db.matches.find_one({"_id": match_id})
-    if not match:
-        raise HTTPException(status_code=404, detail="Match not found")
-    if match.get("status") == "simulated":
-        return match
+# A match is simulated exactly once: the worker that atomically flips it
+# pending -> simulating runs the pipeline; everyone else waits for the result.
+SIMULATE_CLAIM_TTL = 120.0      # seconds before an abandoned "simulating" claim can be retaken
+SIMULATE_POLL_SECONDS = 0.25    # how often other workers check a claimed match
+IDEMPOTENCY_KEY_TTL = 24 * 3600
+
+inflight_simulations: Dict[str, asyncio.Future] = {}
+
+async def claim_match(match_id: str) -> Optional[dict]:
+    """
+    Move the match to "simulating" and return it, or return None once another
+    worker has finished simulating it. Waits while someone else holds the claim.
+    """
+    deadline = asyncio.get_running_loop().time() + SIMULATE_CLAIM_TTL
+    while True:
+        now = datetime.utcnow()
+        match = await db.matches.find_one_and_update(
+            {"_id": match_id, "$or": [
+                {"status": "pending"},
+                {"status": "simulating", "claimedAt": {"$lt": now - timedelta(seconds=SIMULATE_CLAIM_TTL)}}
+            ]},
+            {"$set": {"status": "simulating", "claimedAt": now}},
+            return_document=ReturnDocument.AFTER
+        )
+        if match:
+            return match
+
+        current = await db.matches.find_one({"_id": match_id}, {"status": 1})
+        if not current:
+            raise HTTPException(status_code=404, detail="Match not found")
+        if current.get("status") == "simulated":
+            return None
+        if asyncio.get_running_loop().time() > deadline:
+            raise HTTPException(status_code=409, detail="Match is being simulated by another worker")
+        await asyncio.sleep(SIMULATE_POLL_SECONDS)
+
+async def simulate_match_logic(match_id: str, commentary_mode: str = "auto") -> dict:
+    # concurrent callers in this process share one run; shield it so a dropped
+    # client doesn't cancel the simulation everyone else is waiting on
+    task = inflight_simulations.get(match_id)
+    if task is None:
+        task = asyncio.ensure_future(run_simulation(match_id, commentary_mode))
+        inflight_simulations[match_id] = task
+        task.add_done_callback(lambda _: inflight_simulations.pop(match_id, None))
+    return await asyncio.shield(task)
+
+async def run_simulation(match_id: str, commentary_mode: str) -> dict:
+    match = await claim_match(match_id)
+    if match is None:
+        return await db.matches.find_one({"_id": match_id})
+    try:
+        return await simulate_claimed_match(match, commentary_mode)
+    except BaseException:
+        # hand the claim back if we failed before the result was written (and
+        # nobody has taken it over since)
+        await db.matches.update_one(
+            {"_id": match_id, "status": "simulating", "claimedAt": match["claimedAt"]},
+            {"$set": {"status": "pending"}, "$unset": {"claimedAt": ""}}
+        )
+        raise
+
+def ignore_duplicates(e: BulkWriteError):
+    """Re-raise unless every error is a duplicate key, i.e. the write was already applied."""
+    if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])) or e.details.get("writeConcernErrors"):
+        raise e
+
+async def apply_match_effects(match: dict):
+    """
+    Everything a simulated result feeds besides the match itself: team counters, the
+    bracket snapshot, rollups and, for a Final, the finals history. Each write is a
+    no-op the second time for the same match, so advance_tournament_round can replay
+    the lot for a match left at sideEffectsApplied=False by a worker that died.
+    """
+    match_id, winner_id = match["_id"], match["winner"]
+    loser_id = match["awayTeam"] if winner_id == match["homeTeam"] else match["homeTeam"]
+    final = match["round"] == "Final"
+
+    # a team's next match waits for this round to advance, so lastMatchId is enough to tell
+    for team_id, inc in ((winner_id, {"wins": 1, "finalsCount": 1, "titlesCount": 1} if final else {"wins": 1}),
+                         (loser_id, {"losses": 1, "finalsCount": 1} if final else {"losses": 1})):
+        await db.teams.update_one({"_id": team_id, "lastMatchId": {"$ne": match_id}},
+                                  {"$inc": inc, "$set": {"lastMatchId": match_id}})
+    await record_snapshot_result(match["tournamentId"], match_id, match)
+
+    # incremental team / head-to-head rollups
+    await record_match_rollups(match)
+
+    # if Final, persist finalists & winner history with opponent + score
+    if final:
+        loser = await db.teams.find_one({"_id": loser_id}, {"country": 1}) or {}
+        # Score string from the perspective of the display order (home-away)
+        score_str = f"{match['score']['home']}-{match['score']['away']}"
+        common = {"tournamentId": match["tournamentId"], "date": match.get("playedAt") or datetime.utcnow(),
+                  "score": score_str}
+        # one entry per team and Final: replays hit the same _ids
+        try:
+            await db.team_history.insert_many([
+                {"_id": f"hist_{match_id}_winner", "teamId": winner_id, **common,
+                 "opponent": loser.get("country", loser_id), "result": "winner"},
+                {"_id": f"hist_{match_id}_runner-up", "teamId": loser_id, **common,
+                 "opponent": match.get("winnerName", winner_id), "result": "runner-up"},
+            ], ordered=False)
+        except BulkWriteError as e:
+            ignore_duplicates(e)
+
+    await db.matches.update_one({"_id": match_id, "sideEffectsApplied": False},
+                                {"$set": {"sideEffectsApplied": True}})
+
+async def simulate_claimed_match(match: dict, commentary_mode: str) -> dict:
+    match_id = match["_id"]
 
     # fetch teams
     home = await db.teams.find_one({"_id": match["homeTeam"]})
@@ -1069,9 +3441,8 @@ async def simulate_match_logic(match_id: str) -> dict:
         raise HTTPException(status_code=400, detail="Teams or players missing")
 
     # ratings → lambdas
-    r1, r2 = home.get("rating", 50.0), away.get("rating", 50.0)
-    adv, base = (r1 - r2) / 20.0, 1.2
-    lam1, lam2 = max(0.1, min(4.0, base + adv)), max(0.1, min(4.0, base - adv))
+    r1, r2 = home.get("rating", DEFAULT_TEAM_RATING), away.get("rating", DEFAULT_TEAM_RATING)
+    lam1, lam2 = map(float, match_lambdas(r1, r2))
 
     # simulate goals
     g1, g2 = poisson_sample(lam1), poisson_sample(lam2)
@@ -1081,11 +3452,11 @@ async def simulate_match_logic(match_id: str) -> dict:
     # knockout tiebreakers
     if g1 == g2:
         went_extra = True
-        lam1e, lam2e = lam1 * 0.35, lam2 * 0.35
+        lam1e, lam2e = lam1 * match_model.extraTimeFactor, lam2 * match_model.extraTimeFactor
         g1 += poisson_sample(lam1e)
         g2 += poisson_sample(lam2e)
         if g1 == g2:
-            p_bias = max(0.05, min(0.95, 0.5 + (r1 - r2)/200))
+            p_bias = float(penalty_home_prob(r1, r2))
             winner_id = home["_id"] if random.random() < p_bias else away["_id"]
             penalty_result = {"winner": winner_id}
         else:
@@ -1093,10 +3464,6 @@ async def simulate_match_logic(match_id: str) -> dict:
     else:
         winner_id = home["_id"] if g1 > g2 else away["_id"]
 
-    loser_id = home["_id"] if winner_id != home["_id"] else away["_id"]
-    await db.teams.update_one({"_id": winner_id}, {"$inc": {"wins": 1}})
-    await db.teams.update_one({"_id": loser_id}, {"$inc": {"losses": 1}})
-
     # assign scorers
     events_home = await assign_goal_scorers(home["_id"], g1)
     events_away = await assign_goal_scorers(away["_id"], g2)
@@ -1107,90 +3474,38 @@ async def simulate_match_logic(match_id: str) -> dict:
     winner_name = winner_team["country"] if winner_team else winner_id
 
     
-    commentary = await generate_ai_commentary(
-        home, away, events, went_extra, penalty_result, winner_name
-    )
+    ctx = await build_commentary_context(match_id, home, away, events, went_extra, penalty_result, winner_name)
+    commentary = await commentary_scheduler.generate(ctx, commentary_mode)
 
-    await db.matches.update_one(
-    {"_id": match_id},
-    {"$set": {
+    result = {
         "status": "simulated",
         "score": {"home": g1, "away": g2},
         "goalEvents": events,
         "winner": winner_id,
         "winnerName": winner_name,
+        "wentExtra": went_extra,
+        "penalty_result": penalty_result,
         # save as list instead of a single string
         "commentary": commentary,  
-        "playedAt": datetime.utcnow()
-    }}
-)
-    
-    # Automatically progress the tournament if a round has finished
-    await advance_tournament_round(match["tournamentId"])
-
-     # if Final, persist finalists & winner history with opponent + score
-    if match["round"] == "Final":
-        home_country = home["country"]
-        away_country = away["country"]
-
-        # Score string from the perspective of the display order (home-away)
-        score_str = f"{g1}-{g2}"
-
-        # Identify loser for history
-        loser_id = home["_id"] if winner_id != home["_id"] else away["_id"]
-        loser_team = home if loser_id == home["_id"] else away
-        loser_country = loser_team["country"]
-
-        # Winner's opponent is the loser; runner-up's opponent is the winner
-        winner_opponent = loser_country
-        loser_opponent = winner_name  # winner_name was computed above
-
-        # Common payload fields
-        history_date = datetime.utcnow()
-        tour_id = match["tournamentId"]
-
-        # Push to both teams' finals history
-        finals_entry_winner = {
-            "tournamentId": tour_id,
-            "date": history_date,
-            "opponent": winner_opponent,
-            "score": score_str,
-            "result": "winner"
-        }
-        finals_entry_runner_up = {
-            "tournamentId": tour_id,
-            "date": history_date,
-            "opponent": loser_opponent,
-            "score": score_str,
-            "result": "runner-up"
-        }
-
-        await db.teams.update_one(
-            {"_id": winner_id},
-            {
-                "$push": {
-                    "finalsHistory": finals_entry_winner,
-                    "winnersHistory": {
-                        "tournamentId": tour_id,
-                        "date": history_date,
-                        "opponent": winner_opponent,
-                        "score": score_str
-                    }
-                }
-            }
-        )
-        await db.teams.update_one(
-            {"_id": loser_id},
-            {"$push": {"finalsHistory": finals_entry_runner_up}}
-        )
+        "playedAt": datetime.utcnow(),
+        "homeRating": float(r1),
+        "awayRating": float(r2),
+        # cleared by apply_match_effects once everything the result feeds is written
+        "sideEffectsApplied": False
+    }
+    # the result write is the commit point: it only lands while we still hold the
+    # claim, and everything below runs once, for whoever landed it
+    written = await db.matches.update_one(
+        {"_id": match_id, "status": "simulating", "claimedAt": match["claimedAt"]},
+        {"$set": result, "$unset": {"claimedAt": ""}}
+    )
+    if written.modified_count != 1:
+        return await db.matches.find_one({"_id": match_id})
 
+    await apply_match_effects({**match, **result})
 
-    # If this was a Final, update tournament winner field
-    if match["round"] == "Final":
-        await db.tournaments.update_one(
-            {"_id": match["tournamentId"]},
-            {"$set": {"status": "finished", "winner": winner_id, "winnerName": winner_name}}
-        )
+    # Automatically progress the tournament if a round has finished
+    await advance_tournament_round(match["tournamentId"])
 
     # --- Send emails to federations ---
     try:
@@ -1217,8 +3532,26 @@ async def simulate_match_logic(match_id: str) -> dict:
     return await db.matches.find_one({"_id": match_id})
 
 @app.post("/matches/{match_id}/simulate")
-async def simulate_match(match_id: str, admin=Depends(admin_required)):
-    updated_match = await simulate_match_logic(match_id)
+async def simulate_match(
+    match_id: str,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    admin=Depends(admin_required)
+):
+    """
+    Safe to retry: repeated or concurrent calls return the same simulated match.
+    An Idempotency-Key may only ever be used for one match.
+    """
+    if idempotency_key:
+        try:
+            await db.idempotency_keys.insert_one(
+                {"_id": idempotency_key, "matchId": match_id, "createdAt": datetime.utcnow()}
+            )
+        except DuplicateKeyError:
+            seen = await db.idempotency_keys.find_one({"_id": idempotency_key})
+            if seen and seen["matchId"] != match_id:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used for another match")
+
+    updated_match = await simulate_match_logic(match_id, commentary_mode="featured")
     return {"match": updated_match}
 
 @app.get("/matches/{match_id}")
@@ -1244,7 +3577,35 @@ async def get_match(match_id: str):
 
     return match
 
-@app.get("/matches/{match_id}/details")
+@app.get("/matches/{match_id}/odds")
+async def get_match_odds(match_id: str):
+    """
+    Pre-match odds from the odds table: chance of going through, how it's decided,
+    and the full 90' and extra-time scoreline distributions ([home goals][away goals]).
+    """
+    match = await db.matches.find_one({"_id": match_id}, {"homeTeam": 1, "awayTeam": 1})
+    if not match:
+        raise HTTPException(status_code=404, detail="Match not found")
+    teams = {t["_id"]: t async for t in db.teams.find(
+        {"_id": {"$in": [match["homeTeam"], match["awayTeam"]]}}, {"country": 1, "rating": 1}
+    )}
+    home, away = teams.get(match["homeTeam"], {}), teams.get(match["awayTeam"], {})
+    r1, r2 = float(home.get("rating", DEFAULT_TEAM_RATING)), float(away.get("rating", DEFAULT_TEAM_RATING))
+
+    lam1, lam2 = odds_lookup("lambdas", r1, r2).tolist()
+    return MongoJSONResponse({
+        "matchId": match_id,
+        "homeTeam": {"id": match["homeTeam"], "name": home.get("country", match["homeTeam"]), "rating": r1},
+        "awayTeam": {"id": match["awayTeam"], "name": away.get("country", match["awayTeam"]), "rating": r2},
+        "expectedGoals": {"home": round(lam1, 3), "away": round(lam2, 3)},
+        "probabilities": match_outcome_probs(r1, r2),
+        "regulationScorelines": odds_lookup("regulation", r1, r2).round(6).tolist(),
+        "extraTimeScorelines": odds_lookup("extraTime", r1, r2).round(6).tolist(),
+    })
+
+@app.get("/matches/{match_id}/details", dependencies=[Depends(public_rate_limit)])
+@cached("matches:{match_id}", "teams", "players")
+@coalesced
 async def get_match_details(match_id: str):
     match = await db.matches.find_one({"_id": match_id})
     if not match:
@@ -1276,99 +3637,310 @@ async def get_match_details(match_id: str):
     }
 
     
-# public match viewing
-@app.get("/matches/{match_id}/commentary")
-async def stream_commentary(match_id: str):
-    match = await db.matches.find_one({"_id": match_id})
-    if not match:
-        raise HTTPException(status_code=404, detail="Match not found")
-    
-     # If commentary already exists, stream it back directly
-    if match.get("commentary"):
-        async def replay_existing():
-            for line in match["commentary"]:
-                yield f"data: {line}\n\n"
-        return StreamingResponse(replay_existing(), media_type="text/event-stream")
+# --- Batch tournament simulation (load / balance testing) ---
+SIM_BATCH_MAX = 100_000
+SIM_CHUNK_TOURNAMENTS = 20_000  # tournaments per pool task
+GOALS_HIST_MAX = 10  # goals histograms bucket everything above into the last bin
+
+@app.post("/admin/simulate_batch")
+async def simulate_batch(
+    tournaments: int = Query(100, ge=1, le=SIM_BATCH_MAX),
+    persist: bool = Query(False),
+    seed: Optional[int] = Query(None),
+    admin=Depends(admin_required)
+):
+    """
+    Play `tournaments` whole knockouts in memory with the live match model:
+    the same 8 teams build_quarter_bracket would pick, a fresh random draw each time.
+    No scorers, commentary, emails or live state are touched. Returns aggregates;
+    with persist=true every match also goes to sim_matches in batched inserts.
+    """
+    teams = await db.teams.find(
+        {"squad.0": {"$exists": True}}, {"country": 1, "rating": 1, "createdAt": 1}
+    ).to_list(length=None)
+    if len(teams) < 8:
+        raise HTTPException(status_code=400, detail="Need at least 8 teams with squads")
+    teams = sorted(teams, key=lambda x: x.get("createdAt") or datetime.min)[:8]
+    ids = np.array([t["_id"] for t in teams])
+    ratings = np.array([t.get("rating", DEFAULT_TEAM_RATING) for t in teams], dtype=float)
+
+    # split across the process pool; independent child seeds keep ?seed= reproducible
+    sizes = [min(SIM_CHUNK_TOURNAMENTS, tournaments - i) for i in range(0, tournaments, SIM_CHUNK_TOURNAMENTS)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    chunks = await asyncio.gather(*(run_cpu(play_tournaments, ratings, n, sd) for n, sd in zip(sizes, seeds)))
+    res = {key: np.concatenate([c[key] for c in chunks]) for key in chunks[0]}
+
+    home, away = res["home"].astype(np.int64), res["away"].astype(np.int64)
+    goals_home, goals_away = res["homeGoals"].astype(np.int64), res["awayGoals"].astype(np.int64)
+    winner = np.where(res["homeWin"], home, away)
+    loser = np.where(res["homeWin"], away, home)
+    rated_gap = ratings[home] != ratings[away]
+    upsets = rated_gap & (ratings[winner] < ratings[loser])
+
+    titles = np.bincount(res["champion"].astype(np.int64), minlength=8)
+    finals = np.bincount(np.concatenate([home[:, -1], away[:, -1]]), minlength=8)
+    per_team = sorted((
+        {"teamId": str(ids[i]), "country": teams[i]["country"], "rating": float(ratings[i]),
+         "titles": int(titles[i]), "titleShare": round(titles[i] / tournaments, 4),
+         "finals": int(finals[i])}
+        for i in range(8)
+    ), key=lambda x: -x["titles"])
+
+    summary = {
+        "tournaments": tournaments,
+        "matches": int(home.size),
+        "teams": per_team,
+        "goals": {
+            "perMatchMean": round(float((goals_home + goals_away).mean()), 3),
+            "perTeamHistogram": np.bincount(
+                np.minimum(np.concatenate([goals_home.ravel(), goals_away.ravel()]), GOALS_HIST_MAX),
+                minlength=GOALS_HIST_MAX + 1
+            ).tolist(),
+            "perMatchHistogram": np.bincount(
+                np.minimum(goals_home + goals_away, GOALS_HIST_MAX).ravel(), minlength=GOALS_HIST_MAX + 1
+            ).tolist(),
+        },
+        "upsetRate": round(float(upsets.sum() / max(1, rated_gap.sum())), 4),
+        "extraTimeRate": round(float(res["extra"].mean()), 4),
+        "penaltiesRate": round(float(res["pens"].mean()), 4),
+    }
 
-    home = await db.teams.find_one({"_id": match["homeTeam"]})
-    away = await db.teams.find_one({"_id": match["awayTeam"]})
+    if persist:
+        batch_id = make_id("simbatch")
+        per_tour = len(BRACKET_COLUMNS)
+        flat = {key: res[key].ravel() for key in ("homeGoals", "awayGoals", "extra", "pens")}
+        home_flat, away_flat, winner_flat = home.ravel(), away.ravel(), winner.ravel()
+        # build and insert one batch at a time so the loop gets control back between batches
+        for start in range(0, home_flat.size, BULK_INSERT_BATCH):
+            idx = range(start, min(start + BULK_INSERT_BATCH, home_flat.size))
+            match_ids = make_ids("simmatch", len(idx))
+            docs = [
+                {"_id": str(match_ids[k]), "batchId": batch_id, "tournamentId": f"{batch_id}_{i // per_tour}",
+                 "round": BRACKET_COLUMNS[i % per_tour][0], "slot": BRACKET_COLUMNS[i % per_tour][1],
+                 "homeTeam": str(ids[home_flat[i]]), "awayTeam": str(ids[away_flat[i]]),
+                 "score": {"home": int(flat["homeGoals"][i]), "away": int(flat["awayGoals"][i])},
+                 "wentExtra": bool(flat["extra"][i]), "penalties": bool(flat["pens"][i]),
+                 "winner": str(ids[winner_flat[i]])}
+                for k, i in enumerate(idx)
+            ]
+            await bulk_insert(db.sim_matches, docs)
+        await db.sim_batches.insert_one({"_id": batch_id, "createdAt": datetime.utcnow(), "seed": seed, **summary})
+        summary["batchId"] = batch_id
+
+    return MongoJSONResponse(summary)
+
+
+# --- Server-sent events ---
+SSE_KEEPALIVE_SECONDS = 15
+
+def sse_event(event_id: int, data: str, event: Optional[str] = None) -> str:
+    lines = [f"id: {event_id}"]
+    if event:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {part}" for part in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+def last_event_id(request: Request) -> int:
+    try:
+        return max(0, int(request.headers.get("last-event-id", "0")))
+    except ValueError:
+        return 0
 
-    # Build goals summary for prompt
-    goals_summary = []
-    for ev in match.get("goalEvents", []):
-        player = await db.players.find_one({"_id": ev["playerId"]})
-        if player:
-            team_name = home["country"] if ev["teamId"] == home["_id"] else away["country"]
-            goals_summary.append(f"{ev['minute']}' - {player['name']} ({team_name})")
+class SSEBroadcast:
+    """
+    Append-only list of lines shared by every client of one producer.
+    Event ids are 1-based line positions, so a reconnect with Last-Event-ID
+    resumes exactly where it left off instead of restarting the producer.
+    """
 
-    winner_name = match.get("winnerName") or "Undecided"
+    def __init__(self):
+        self.lines: List[str] = []
+        self.done = False
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, line: str):
+        self.lines.append(line)
+        self._wake()
+
+    def finish(self):
+        self.done = True
+        self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self, after: int = 0):
+        sent = after
+        while True:
+            changed = self._changed
+            while sent < len(self.lines):
+                sent += 1
+                yield sse_event(sent, self.lines[sent - 1])
+            if self.done:
+                yield sse_event(sent, "", event="end")
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
 
-    prompt = f"""
-    You are a lively football commentator.
-    Generate exciting commentary for a knockout match:
-    {home['country']} vs {away['country']}.
+# one in-flight LLM generation per match, shared by all viewers
+commentary_broadcasts: Dict[str, SSEBroadcast] = {}
 
-    Goals:
-    {chr(10).join(goals_summary) if goals_summary else "No goals yet"}
+async def run_commentary_stream(match: dict, broadcast: SSEBroadcast):
+    match_id = match["_id"]
+    try:
+        home = await db.teams.find_one({"_id": match["homeTeam"]})
+        away = await db.teams.find_one({"_id": match["awayTeam"]})
+        ctx = await build_commentary_context(
+            match_id, home, away, match.get("goalEvents", []),
+            match.get("wentExtra"), match.get("penalty_result"),
+            match.get("winnerName") or "Undecided"
+        )
+        try:
+            async for sentence in commentary_scheduler.llm.stream(ctx):
+                broadcast.publish(sentence)
+        except httpx.HTTPError as e:
+            print("Ollama stream failed:", e)
+        if not broadcast.lines:
+            for sentence in await commentary_scheduler.template.generate(ctx):
+                broadcast.publish(sentence)
 
-    Extra time: {"Yes" if match.get("wentExtra") else "No"}
-    Penalties: {"Yes" if match.get("penalty_result") else "No"}
-    Winner: {winner_name}
+        # Save finished commentary to DB
+        await db.matches.update_one({"_id": match_id}, {"$set": {"commentary": broadcast.lines}})
+    finally:
+        broadcast.finish()
+        commentary_broadcasts.pop(match_id, None)
 
-    Rules:
-    - Start with kickoff
-    - Mention goals with excitement
-    - Add variety (near misses, atmosphere, tension)
-    - End with final whistle and winner
-    - Keep it 8–12 sentences, short and punchy
+# public match viewing
+@app.get("/matches/{match_id}/commentary")
+async def stream_commentary(match_id: str, request: Request):
+    after = last_event_id(request)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+    broadcast = commentary_broadcasts.get(match_id)
+    if broadcast is None:
+        match = await db.matches.find_one({"_id": match_id})
+        if not match:
+            raise HTTPException(status_code=404, detail="Match not found")
+
+        # If commentary already exists, stream it back directly
+        if match.get("commentary"):
+            async def replay_existing():
+                lines = match["commentary"]
+                for i in range(after, len(lines)):
+                    yield sse_event(i + 1, lines[i])
+                yield sse_event(len(lines), "", event="end")
+            return StreamingResponse(replay_existing(), media_type="text/event-stream", headers=headers)
+
+        broadcast = commentary_broadcasts.get(match_id)
+        if broadcast is None:
+            broadcast = commentary_broadcasts[match_id] = SSEBroadcast()
+            broadcast.task = asyncio.create_task(run_commentary_stream(match, broadcast))
+
+    return StreamingResponse(broadcast.follow(after), media_type="text/event-stream", headers=headers)
+
+# --- Live match timeline (server-paced SSE) ---
+LIVE_RETENTION_SECONDS = 60  # finished broadcasts linger so late reconnects can resume
+# playback speeds on offer; each (match, speed) gets one shared broadcaster, so the set is fixed
+LIVE_SPEEDS = (1, 2, 5, 10, 30, 60)
+
+# one timer-driven broadcaster per (match, speed), shared by every viewer
+live_broadcasts: Dict[tuple, SSEBroadcast] = {}
+
+async def build_live_timeline(match: dict) -> List[Dict[str, Any]]:
     """
+    Every event of a simulated match keyed by its simulated minute: a clock tick
+    per minute, goals (with running score) and commentary lines spread evenly
+    over the match. Sorted, so event ids are stable across broadcasts.
+    """
+    teams = {t["_id"]: t["country"] async for t in db.teams.find(
+        {"_id": {"$in": [match["homeTeam"], match["awayTeam"]]}}, {"country": 1})}
+    goal_events = sorted(match.get("goalEvents", []), key=lambda ev: ev["minute"])
+    players = {p["_id"]: p["name"] async for p in db.players.find(
+        {"_id": {"$in": [ev["playerId"] for ev in goal_events]}}, {"name": 1})}
+    end_minute = 120 if match.get("wentExtra") else 90
+
+    events = [(m, 0, {"type": "clock", "minute": m}) for m in range(end_minute + 1)]
+    home_goals = away_goals = 0
+    for ev in goal_events:
+        is_home = ev["teamId"] == match["homeTeam"]
+        home_goals += is_home
+        away_goals += not is_home
+        events.append((ev["minute"], 1, {
+            "type": "goal",
+            "minute": ev["minute"],
+            "team": "home" if is_home else "away",
+            "teamName": teams.get(ev["teamId"], ev["teamId"]),
+            "playerName": players.get(ev["playerId"], ev["playerId"]),
+            "score": {"home": home_goals, "away": away_goals}
+        }))
+    lines = match.get("commentary", [])
+    for k, text in enumerate(lines):
+        minute = round(k * end_minute / (len(lines) - 1)) if len(lines) > 1 else 0
+        events.append((minute, 2, {"type": "comment", "minute": minute, "text": text}))
+
+    events.sort(key=lambda e: (e[0], e[1]))
+    events.append((end_minute, 3, {
+        "type": "fulltime",
+        "minute": end_minute,
+        "score": match.get("score", {"home": 0, "away": 0}),
+        "winnerName": match.get("winnerName")
+    }))
+    return [payload for _, _, payload in events]
 
-    async def event_generator():
-        buffer = ""
-        commentary_lines = []
-
-        async with httpx.AsyncClient(timeout=300.0) as client:
-            async with client.stream(
-                "POST",
-                "http://localhost:11434/api/generate",
-                json={
-                    "model": "gemma:2b",
-                    "prompt": prompt,
-                    "options": {"temperature": 0.7, "num_predict": 300}
-                }
-            ) as resp:
-                async for line in resp.aiter_lines():
-                    if not line.strip():
-                        continue
-                    try:
-                        data = json.loads(line)
-                        if "response" in data:
-                            buffer += data["response"]
-
-                            # Check if sentence-ending punctuation exists
-                            while any(p in buffer for p in [".", "!", "?"]):
-                                for punct in [".", "!", "?"]:
-                                    if punct in buffer:
-                                        sentence, buffer = buffer.split(punct, 1)
-                                        sentence = sentence.strip()
-                                        if sentence:
-                                            full_sentence = sentence + punct
-                                            commentary_lines.append(full_sentence)
-                                            yield f"data: {full_sentence}\n\n"
-                    except:
-                        continue
-
-        # Save finished commentary to DB
-        if commentary_lines:
-            await db.matches.update_one(
-                {"_id": match_id},
-                {"$set": {"commentary": commentary_lines}}
-            )
+async def run_live_timeline(key: tuple, match: dict, speed: int, broadcast: SSEBroadcast):
+    loop = asyncio.get_running_loop()
+    try:
+        timeline = await build_live_timeline(match)
+        started, seconds_per_minute = loop.time(), 1.0 / speed
+        for payload in timeline:
+            # absolute schedule: no drift however long publishing takes
+            delay = started + payload["minute"] * seconds_per_minute - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            broadcast.publish(orjson.dumps(payload).decode())
+    finally:
+        broadcast.finish()
+        loop.call_later(
+            LIVE_RETENTION_SECONDS,
+            lambda: live_broadcasts.get(key) is broadcast and live_broadcasts.pop(key)
+        )
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+@app.get("/matches/{match_id}/live")
+async def stream_match_live(match_id: str, request: Request, speed: int = 1):
+    """
+    Replay a simulated match in (sped-up) real time: one simulated minute every
+    1/speed seconds, speed one of LIVE_SPEEDS. Events are JSON in the SSE data
+    field; reconnecting with Last-Event-ID resumes after that event.
+    """
+    if speed not in LIVE_SPEEDS:
+        raise HTTPException(status_code=400, detail=f"speed must be one of: {', '.join(map(str, LIVE_SPEEDS))}")
+    key = (match_id, speed)
+    broadcast = live_broadcasts.get(key)
+    if broadcast is None:
+        match = await db.matches.find_one({"_id": match_id})
+        if not match:
+            raise HTTPException(status_code=404, detail="Match not found")
+        if match.get("status") != "simulated":
+            raise HTTPException(status_code=400, detail="Match has not been played yet")
+        broadcast = live_broadcasts.get(key)
+        if broadcast is None:
+            broadcast = live_broadcasts[key] = SSEBroadcast()
+            broadcast.task = asyncio.create_task(run_live_timeline(key, match, speed, broadcast))
+
+    return StreamingResponse(
+        broadcast.follow(last_event_id(request)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # public leaderboard functionality
-@app.get("/stats/topscorers")
+@app.get("/stats/topscorers", dependencies=[Depends(public_rate_limit)])
+@cached("matches", "players", "teams")
+@coalesced
 async def get_top_scorers(limit: int = 10):
     pipeline = [
         {"$unwind": "$goalEvents"},
@@ -1390,57 +3962,35 @@ async def get_top_scorers(limit: int = 10):
 # Reset tournament to quarter finals (clears matches and tournament doc)
 @app.post("/tournament/reset")
 async def reset_tournament(admin=Depends(admin_required)):
+    # finished seasons are kept in the archive; only unfinished ones are discarded
+    seasons = await archive_finished_tournaments()
     await db.matches.delete_many({})
     await db.tournaments.delete_many({})
-    return {"message": "Tournament reset to initial state (quarterfinals cleared)."}
+    return {"message": "Tournament reset to initial state (quarterfinals cleared).", "archivedSeasons": seasons}
 
 #Auto simulate tournaments
 @app.post("/tournament/auto_simulate")
 async def auto_simulate_tournament(admin=Depends(admin_required)):
 
     # Get the current tournament
-    tournament = await db.tournaments.find_one({"status": "in_progress"})
+    tournament = await db.tournaments.find_one({"status": "in_progress"}, sort=[("createdAt", -1)])
     if not tournament:
         raise HTTPException(status_code=404, detail="No tournament in progress")
 
-    current_round = tournament.get("current_round", "QuarterFinal")
-
-    # Define round order
-    round_order = ["QuarterFinal", "SemiFinal", "Final"]
+    current_round = tournament.get("current_round", TOURNAMENT_ROUNDS[0])
 
-    # Find current matches that aren’t simulated yet
+    # Find this tournament's current matches that aren’t simulated yet
     current_matches = await db.matches.find(
-        {"round": current_round, "status": {"$ne": "simulated"}}
-    ).to_list(None)
-
-    if not current_matches:
-        # If no matches left in current round, advance
-        current_index = round_order.index(current_round)
-        if current_index + 1 < len(round_order):
-            next_round = round_order[current_index + 1]
-            await db.tournaments.update_one(
-                {"_id": tournament["_id"]},
-                {"$set": {"current_round": next_round}}
-            )
-            return {"message": f"Advanced to {next_round}."}
-        else:
-            # No more rounds = tournament finished
-            tournament = await db.tournaments.find_one({"_id": tournament["_id"]})
-            return {"message": "Tournament finished.", "tournament": tournament}
+        {"tournamentId": tournament["_id"], "round": current_round, "status": {"$ne": "simulated"}}
+    ).sort("slot", 1).to_list(None)
 
-    # Simulate each match using match logic
-    results = []
-    winners = []
+    # Simulate each match using match logic (which advances the round when it completes)
     for match in current_matches:
         match_id = str(match["_id"])
-        simulated = await simulate_match_logic(match_id)
+        # bulk rounds get template commentary; the Final is worth the LLM
+        mode = "featured" if current_round == "Final" else "bulk"
+        simulated = await simulate_match_logic(match_id, commentary_mode=mode)
         winner_id = simulated.get("winner")
-        winners.append(winner_id)
-        results.append({
-            "match_id": match_id,
-            "round": current_round,
-            "winner": winner_id
-        })
 
         # Remove losing teams from tournament
         loser_id = match["homeTeam"] if winner_id != match["homeTeam"] else match["awayTeam"]
@@ -1449,50 +3999,13 @@ async def auto_simulate_tournament(admin=Depends(admin_required)):
             {"$pull": {"teams": loser_id}}
         )
 
-    # After all matches are simulated, build next round if needed
-    current_index = round_order.index(current_round)
-    if current_index + 1 < len(round_order):
-        next_round = round_order[current_index + 1]
-        
-        # prevent duplicate creation of next round
-        existing_next = await db.matches.count_documents({
-            "tournamentId": tournament["_id"],
-            "round": next_round
-        })
-        if existing_next > 0:
-            print(f"Skipping creation of {next_round}, already exists.")
-            return {"message": f"{next_round} already created previously. No duplicates made."}
-
-        new_matches = []
-        for i in range(0, len(winners), 2):
-            if i + 1 < len(winners):
-                new_match = MatchInDB(
-                    round=next_round,
-                    homeTeam=winners[i],
-                    awayTeam=winners[i + 1]
-                ).dict()
-                new_match["_id"] = make_id("match")
-                new_match["tournamentId"] = tournament["_id"]  
-                new_matches.append(new_match)
-
-        if new_matches:
-            await db.matches.insert_many(new_matches)
-            await db.tournaments.update_one(
-                {"_id": tournament["_id"]},
-                {
-                    "$set": {"current_round": next_round},
-                    "$push": {"bracket": {"$each": [m["_id"] for m in new_matches]}} 
-                }
-            )
-            return {"message": f"Advanced to {next_round}."}
-
-    # If we reach here, the final has already been simulated by simulate_match_logic
-    final_match = await db.matches.find_one({"round": "Final", "tournamentId": tournament["_id"]})
-    if final_match:
-        winner_name = final_match.get("winnerName")
-        return {"message": "Tournament finished.", "winner": winner_name}
-
-    return {"message": "Tournament finished, but no final match found."}
+    # no-op if the round was already advanced (e.g. by a concurrent request)
+    tournament = await advance_tournament_round(tournament["_id"])
+    if tournament is None:
+        raise HTTPException(status_code=409, detail="Tournament was reset while it was being simulated")
+    if tournament["status"] == "finished":
+        return {"message": "Tournament finished.", "winner": tournament.get("winnerName")}
+    return {"message": f"Advanced to {tournament['current_round']}."}
 
 @app.post("/tournament/rebuild_bracket")
 async def rebuild_bracket(admin=Depends(admin_required)):
@@ -1500,7 +4013,8 @@ async def rebuild_bracket(admin=Depends(admin_required)):
     Wipes current tournament + matches, then rebuilds a new tournament bracket
     with the TOP 8 teams by rating (descending). Requires at least 8 teams.
     """
-    # 1) wipe current tournaments + matches
+    # 1) archive finished seasons, wipe current tournaments + matches
+    await archive_finished_tournaments()
     await db.matches.delete_many({})
     await db.tournaments.delete_many({})
 
@@ -1509,59 +4023,257 @@ async def rebuild_bracket(admin=Depends(admin_required)):
     if len(teams) < 8:
         raise HTTPException(status_code=400, detail="At least 8 teams are required to rebuild the bracket")
 
-    teams_sorted = sorted(teams, key=lambda t: float(t.get("rating", 0.0)), reverse=True)
+    teams_sorted = sorted(teams, key=lambda t: float(t.get("rating", DEFAULT_TEAM_RATING)), reverse=True)
     top8 = teams_sorted[:8]
 
     # 3) create new tournament doc
     tournament_id = make_id("tournament")
-    tournament_doc = {
-        "_id": tournament_id,
-        "status": "in_progress",
-        "current_round": "QuarterFinal",
-        "bracket": [],
-        "teams": [t["_id"] for t in top8],
-        "createdAt": datetime.utcnow()
-    }
-    await db.tournaments.insert_one(tournament_doc)
 
-    # 4) pair up and insert quarter-final matches
+    # 4) pair up quarter-final matches
     random.shuffle(top8)  
-    match_ids = []
-    for i in range(0, 8, 2):
-        m_id = make_id("match")
-        m = MatchInDB(round="QuarterFinal", homeTeam=top8[i]["_id"], awayTeam=top8[i+1]["_id"]).dict()
-        m["_id"] = m_id
-        m["tournamentId"] = tournament_id
-        await db.matches.insert_one(m)
-        match_ids.append(m_id)
-
-    # 5) update tournament with bracket
-    await db.tournaments.update_one({"_id": tournament_id}, {"$set": {"bracket": match_ids}})
+    new_matches = pair_round_matches(tournament_id, "QuarterFinal", [t["_id"] for t in top8])
+
+    # 5) insert tournament with its bracket, then the matches
+    tournament_doc = new_tournament_doc(tournament_id, top8, new_matches)
+    try:
+        await db.tournaments.insert_one(tournament_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Bracket is being rebuilt by another request")
+    await db.matches.insert_many(new_matches)
 
     # return bracket like /tournament/bracket does
-    tour = await db.tournaments.find_one({"_id": tournament_id})
-    matches = []
-    for mid in match_ids:
-        m = await db.matches.find_one({"_id": mid})
-        if not m:
-            continue
-        home_team = await db.teams.find_one({"_id": m["homeTeam"]})
-        away_team = await db.teams.find_one({"_id": m["awayTeam"]})
-        m["homeTeamName"] = home_team["country"] if home_team else m["homeTeam"]
-        m["awayTeamName"] = away_team["country"] if away_team else m["awayTeam"]
-        m["homeRating"]   = float(home_team.get("rating", 0)) if home_team else 0.0
-        m["awayRating"]   = float(away_team.get("rating", 0)) if away_team else 0.0
+    matches = bracket_matches(tournament_doc)
+    tour = {k: v for k, v in tournament_doc.items() if k != "snapshot"}
+    return {"message": "Bracket rebuilt from top 8 by rating.", "tournament": tour, "matches": matches}
 
-        import math
-        diff = m["homeRating"] - m["awayRating"]
-        p_home = 1.0 / (1.0 + math.exp(-diff / 8.0))
-        m["expectedHomeWin"] = round(p_home * 100, 1)
-        m["expectedAwayWin"] = round((1 - p_home) * 100, 1)
 
-        matches.append(m)
+# --- Admin maintenance jobs: wipe / reseed / reset with SSE progress ---
+# Resetting a large (load-test sized) dataset outlives any proxy timeout as a single
+# request, so these run as background tasks. Deletes go in _id batches, or with
+# mode=drop the collection is dropped and its indexes recreated, which takes the
+# same time at any size. Reseeding goes through batched inserts. Every job publishes
+# JSON progress lines (phase, done/total, docs per second) to an SSEBroadcast, so
+# GET /admin/jobs/{id}/events can be followed and resumed with Last-Event-ID.
+# Jobs live in the worker that started them. One runs at a time across all workers:
+# the runner holds a lock document in settings, renewed while it runs, which a
+# crashed holder's lock outlives by at most MAINTENANCE_LOCK_TTL.
+MAINTENANCE_DELETE_BATCH = int(os.getenv("MAINTENANCE_DELETE_BATCH", "10000"))
+MAINTENANCE_RETENTION_SECONDS = 3600  # finished jobs stay queryable this long
+MAINTENANCE_LOCK_TTL = int(os.getenv("MAINTENANCE_LOCK_TTL", "120"))
+MAINTENANCE_MODES = ("batches", "drop")
+
+class MaintenanceJob:
+    def __init__(self, kind: str, params: Dict[str, Any]):
+        self.id = make_id("job")
+        self.kind, self.params = kind, params
+        self.status = "running"
+        self.startedAt = datetime.utcnow()
+        self.finishedAt: Optional[datetime] = None
+        self.result: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.phase: Optional[str] = None
+        self.phase_total: Optional[int] = None
+        self.phase_started = self.started = time.monotonic()
+        self.broadcast = SSEBroadcast()
+
+    def start_phase(self, phase: str, total: Optional[int] = None):
+        self.phase, self.phase_total, self.phase_started = phase, total, time.monotonic()
+        self.advance(0)
+
+    def advance(self, done: int):
+        now = time.monotonic()
+        elapsed = now - self.phase_started
+        self.broadcast.publish(orjson.dumps({
+            "phase": self.phase,
+            "done": done,
+            "total": self.phase_total,
+            "docsPerSecond": round(done / elapsed, 1) if elapsed > 0 else None,
+            "elapsedSeconds": round(now - self.started, 3),
+        }).decode())
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "jobId": self.id, "kind": self.kind, "params": self.params, "status": self.status,
+            "phase": self.phase, "startedAt": self.startedAt, "finishedAt": self.finishedAt,
+            "result": self.result, "error": self.error, "events": len(self.broadcast.lines),
+        }
 
-    return {"message": "Bracket rebuilt from top 8 by rating.", "tournament": tour, "matches": matches}
+maintenance_jobs: Dict[str, MaintenanceJob] = {}
 
+async def insert_in_batches(collection, docs: List[Dict[str, Any]], job: Optional[MaintenanceJob] = None) -> int:
+    if job:
+        job.start_phase(f"insert {collection.name}", len(docs))
+    inserted = 0
+    for start in range(0, len(docs), BULK_INSERT_BATCH):
+        batch = docs[start:start + BULK_INSERT_BATCH]
+        inserted += len(batch) - len(await bulk_insert(collection, batch))
+        if job:
+            job.advance(inserted)
+    return inserted
+
+async def delete_in_batches(collection, job: Optional[MaintenanceJob] = None, flt: Optional[dict] = None) -> int:
+    """
+    Delete matching docs MAINTENANCE_DELETE_BATCH _ids at a time; keeps each write short.
+    Pages forward in _id order, so each batch starts where the last one ended instead
+    of rescanning the deleted range.
+    """
+    flt = flt or {}
+    total = await collection.count_documents(flt) if flt else await collection.estimated_document_count()
+    if job:
+        job.start_phase(f"delete {collection.name}", total)
+    deleted = 0
+    page = flt
+    while True:
+        batch = await collection.find(page, {"_id": 1}).sort("_id", 1).limit(MAINTENANCE_DELETE_BATCH).to_list(length=None)
+        if not batch:
+            return deleted
+        page = {"$and": [flt, {"_id": {"$gt": batch[-1]["_id"]}}]}
+        res = await collection.delete_many({"_id": {"$in": [d["_id"] for d in batch]}})
+        deleted += res.deleted_count
+        if job:
+            job.advance(deleted)
+
+async def drop_and_recreate(collection, job: Optional[MaintenanceJob] = None) -> int:
+    """Drop the whole collection, then put its declared indexes back."""
+    total = await collection.estimated_document_count()
+    if job:
+        job.start_phase(f"drop {collection.name}", total)
+    await collection.drop()
+    await ensure_indexes([collection.name])
+    if job:
+        job.advance(total)
+    return total
+
+async def wipe_collection(collection, mode: str, job: Optional[MaintenanceJob] = None) -> int:
+    if mode == "drop":
+        return await drop_and_recreate(collection, job)
+    return await delete_in_batches(collection, job)
+
+async def wipe_teams_job(job: MaintenanceJob) -> Dict[str, Any]:
+    mode = job.params["mode"]
+    players = await wipe_collection(db.players, mode, job)
+    teams = await wipe_collection(db.teams, mode, job)
+    team_keys.clear()
+    return {"playersDeleted": players, "teamsDeleted": teams}
+
+async def reseed_job(job: MaintenanceJob) -> Dict[str, Any]:
+    result = await wipe_teams_job(job)
+    if job.params["demo_teams"]:
+        result["created"] = await seed_demo_squads(job)
+    if job.params["load_test_teams"]:
+        result["loadTestPlayersInserted"] = await seed_load_test_squads(job.params["load_test_teams"], job)
+    return result
+
+async def reset_tournament_job(job: MaintenanceJob) -> Dict[str, Any]:
+    job.start_phase("archive finished seasons")
+    seasons = await archive_finished_tournaments()
+    job.advance(len(seasons))
+    mode = job.params["mode"]
+    matches = await wipe_collection(db.matches, mode, job)
+    tournaments = await wipe_collection(db.tournaments, mode, job)
+    return {"archivedSeasons": seasons, "matchesDeleted": matches, "tournamentsDeleted": tournaments}
+
+async def acquire_maintenance_lock(job: MaintenanceJob) -> bool:
+    now = datetime.utcnow()
+    try:
+        # matches only an expired lock; otherwise the upsert collides on _id
+        await db.settings.update_one(
+            {"_id": "maintenance_lock", "expiresAt": {"$lt": now}},
+            {"$set": {"jobId": job.id, "kind": job.kind, "expiresAt": now + timedelta(seconds=MAINTENANCE_LOCK_TTL)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+async def renew_maintenance_lock(job: MaintenanceJob):
+    while True:
+        await asyncio.sleep(MAINTENANCE_LOCK_TTL / 3)
+        await db.settings.update_one(
+            {"_id": "maintenance_lock", "jobId": job.id},
+            {"$set": {"expiresAt": datetime.utcnow() + timedelta(seconds=MAINTENANCE_LOCK_TTL)}}
+        )
+
+async def release_maintenance_lock(job: MaintenanceJob):
+    try:
+        await db.settings.delete_one({"_id": "maintenance_lock", "jobId": job.id})
+    except Exception as e:
+        print("Maintenance lock not released (expires on its own):", e)
+
+async def run_maintenance_job(job: MaintenanceJob, steps):
+    renewal = asyncio.create_task(renew_maintenance_lock(job))
+    try:
+        job.result = await steps(job)
+        job.status = "done"
+    except Exception as e:
+        job.status, job.error = "failed", str(e)
+    finally:
+        renewal.cancel()
+        await release_maintenance_lock(job)
+        job.finishedAt = datetime.utcnow()
+        job.broadcast.publish(orjson.dumps({
+            "phase": job.status, "result": job.result, "error": job.error,
+            "elapsedSeconds": round(time.monotonic() - job.started, 3),
+        }).decode())
+        job.broadcast.finish()
+        asyncio.get_running_loop().call_later(
+            MAINTENANCE_RETENTION_SECONDS, lambda: maintenance_jobs.pop(job.id, None)
+        )
+
+async def start_maintenance_job(kind: str, params: Dict[str, Any], steps) -> JSONResponse:
+    if params.get("mode", MAINTENANCE_MODES[0]) not in MAINTENANCE_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(MAINTENANCE_MODES)}")
+    job = MaintenanceJob(kind, params)
+    if not await acquire_maintenance_lock(job):
+        raise HTTPException(status_code=409, detail="Another maintenance job is still running")
+    maintenance_jobs[job.id] = job
+    job.broadcast.task = asyncio.create_task(run_maintenance_job(job, steps))
+    return JSONResponse(status_code=202, content={
+        "jobId": job.id, "status": f"/admin/jobs/{job.id}", "events": f"/admin/jobs/{job.id}/events"
+    })
+
+@app.post("/admin/jobs/wipe_teams")
+async def start_wipe_teams(mode: str = "batches", admin=Depends(admin_required)):
+    """Remove every team and player in the background (?mode=batches|drop)."""
+    return await start_maintenance_job("wipe_teams", {"mode": mode}, wipe_teams_job)
+
+@app.post("/admin/jobs/reseed")
+async def start_reseed(
+    mode: str = "batches",
+    demo_teams: bool = True,
+    load_test_teams: int = Query(0, ge=0, le=1_000_000),
+    admin=Depends(admin_required)
+):
+    """Wipe teams + players, then seed the demo teams and/or load-test squads."""
+    params = {"mode": mode, "demo_teams": demo_teams, "load_test_teams": load_test_teams}
+    return await start_maintenance_job("reseed", params, reseed_job)
+
+@app.post("/admin/jobs/reset_tournament")
+async def start_reset_tournament(mode: str = "batches", admin=Depends(admin_required)):
+    """Background /tournament/reset: archive finished seasons, clear matches + tournaments."""
+    return await start_maintenance_job("reset_tournament", {"mode": mode}, reset_tournament_job)
+
+@app.get("/admin/jobs")
+async def list_maintenance_jobs(admin=Depends(admin_required)):
+    return [job.summary() for job in maintenance_jobs.values()]
+
+@app.get("/admin/jobs/{job_id}")
+async def get_maintenance_job(job_id: str, admin=Depends(admin_required)):
+    job = maintenance_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found (finished jobs expire; jobs are per worker)")
+    return job.summary()
+
+@app.get("/admin/jobs/{job_id}/events")
+async def stream_maintenance_job(job_id: str, request: Request, admin=Depends(admin_required)):
+    job = maintenance_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found (finished jobs expire; jobs are per worker)")
+    return StreamingResponse(
+        job.broadcast.follow(last_event_id(request)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.post("/test-email")
 async def test_email(background_tasks: BackgroundTasks):
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("MAIL_USERNAME", "test")
+os.environ.setdefault("MAIL_PASSWORD", "test")
+os.environ.setdefault("MAIL_FROM", "test@example.com")
+os.environ.setdefault("MAIL_SERVER", "localhost")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mongomock_motor  # noqa: E402  (requirements-dev.txt)
+import main  # noqa: E402
+from mongomock.collection import BulkOperationBuilder  # noqa: E402
+
+# newer pymongo passes sort= to bulk update ops, which mongomock doesn't accept yet
+_add_update = BulkOperationBuilder.add_update
+BulkOperationBuilder.add_update = lambda self, *args, sort=None, **kwargs: _add_update(self, *args, **kwargs)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = mongomock_motor.AsyncMongoMockClient()["test"]
+    monkeypatch.setattr(main, "db", database)
+    return database
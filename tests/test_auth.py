@@ -0,0 +1,26 @@
+import time
+
+import pytest
+from fastapi import HTTPException
+
+import main
+
+
+@pytest.fixture
+def non_utc_host(monkeypatch):
+    monkeypatch.setenv("TZ", "Africa/Johannesburg")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_expired_cached_token_rejected_on_non_utc_host(non_utc_host, monkeypatch):
+    monkeypatch.setattr(main, "verified_tokens", main.OrderedDict())
+    token = "cached.expired.token"
+    main.verified_tokens[main.token_key(token)] = {"sub": "admin", "exp": int(time.time()) - 30 * 60}
+
+    with pytest.raises(HTTPException) as exc:
+        main.verify_jwt_cached(token)
+    assert exc.value.status_code == 401
+    assert main.token_key(token) not in main.verified_tokens
@@ -0,0 +1,33 @@
+import asyncio
+
+import main
+
+
+def test_single_doc_epochs_do_not_accumulate(monkeypatch):
+    monkeypatch.setattr(main, "read_cache", main.ReadCache(16))
+    for i in range(10_000):
+        main.cache_sync.apply_change({"operationType": "insert", "ns": {"coll": "players"},
+                                      "documentKey": {"_id": f"player_{i}"}})
+    assert not any(":" in tag for tag in main.read_cache.epochs)
+
+
+def test_write_during_fill_is_not_cached(monkeypatch):
+    monkeypatch.setattr(main, "read_cache", main.ReadCache(16))
+    monkeypatch.setattr(main.cache_sync, "mode", "poll")
+    calls = []
+
+    @main.cached("teams:{team_id}")
+    async def load(team_id):
+        calls.append(team_id)
+        if len(calls) == 1:  # a write lands while the first read is in flight
+            main.read_cache.invalidate("teams", team_id)
+        return {"calls": len(calls)}
+
+    async def run():
+        assert await load(team_id="team_a") == {"calls": 1}
+        assert await load(team_id="team_a") == {"calls": 2}
+        assert await load(team_id="team_a") == {"calls": 2}
+
+    asyncio.run(run())
+    assert not main.read_cache.filling
+    assert "teams:team_a" not in main.read_cache.epochs
@@ -0,0 +1,25 @@
+from starlette.requests import Request
+
+import main
+
+
+def request_with(forwarded, host="10.0.0.1"):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded is not None else []
+    return Request({"type": "http", "headers": headers, "client": (host, 1234)})
+
+
+def test_client_key_ignores_spoofed_forwarded_hops(monkeypatch):
+    monkeypatch.setattr(main, "RATE_LIMIT_TRUST_PROXY", True)
+    monkeypatch.setattr(main, "RATE_LIMIT_TRUSTED_PROXIES", 1)
+    assert main.client_key(request_with("1.2.3.4, 203.0.113.7")) == "203.0.113.7"
+    assert main.client_key(request_with("5.6.7.8, 203.0.113.7")) == "203.0.113.7"
+
+    monkeypatch.setattr(main, "RATE_LIMIT_TRUSTED_PROXIES", 2)
+    assert main.client_key(request_with("1.2.3.4, 203.0.113.7, 10.0.0.2")) == "203.0.113.7"
+    # fewer hops than proxies: the header didn't come through our chain
+    assert main.client_key(request_with("203.0.113.7")) == "10.0.0.1"
+
+
+def test_client_key_without_trusted_proxy(monkeypatch):
+    monkeypatch.setattr(main, "RATE_LIMIT_TRUST_PROXY", False)
+    assert main.client_key(request_with("1.2.3.4")) == "10.0.0.1"
@@ -0,0 +1,126 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import main
+
+
+async def seed_final(db):
+    for team_id, country in (("team_a", "Alpha"), ("team_b", "Beta")):
+        squad = [f"{team_id}_p{i}" for i in range(3)]
+        await db.teams.insert_one({
+            "_id": team_id, "country": country, "rating": 60.0, "squad": squad,
+            "representativeEmail": f"{team_id}@example.com", "wins": 0, "losses": 0,
+        })
+        await db.players.insert_many([
+            {"_id": pid, "teamId": team_id, "name": pid, "ratings": {"GK": 50, "DF": 50, "MD": 50, "AT": 50}}
+            for pid in squad
+        ])
+    match = {"_id": "match_final", "tournamentId": "tour_1", "round": "Final", "slot": 0,
+             "homeTeam": "team_a", "awayTeam": "team_b", "status": "pending"}
+    await db.matches.insert_one(match)
+    teams = {t["_id"]: t async for t in db.teams.find()}
+    await db.tournaments.insert_one({
+        "_id": "tour_1", "status": "in_progress", "current_round": "Final", "bracket": [match["_id"]],
+        "snapshot": {match["_id"]: main.snapshot_entry(match, teams)}, "snapshotVersion": 0, "matchesPlayed": 0,
+    })
+
+
+async def assert_applied_once(db):
+    match = await db.matches.find_one({"_id": "match_final"})
+    assert match["status"] == "simulated"
+    assert "claimedAt" not in match
+
+    teams = [t async for t in db.teams.find()]
+    assert sum(t.get("wins", 0) for t in teams) == 1
+    assert sum(t.get("losses", 0) for t in teams) == 1
+    assert sum(t.get("finalsCount", 0) for t in teams) == 2
+    assert await db.team_history.count_documents({}) == 2
+    assert sum([s["played"] async for s in db.team_stats.find()]) == 2
+
+    tour = await db.tournaments.find_one({"_id": "tour_1"})
+    assert tour["matchesPlayed"] == 1
+    assert tour["snapshot"]["match_final"]["status"] == "simulated"
+    assert tour["status"] == "finished"
+
+
+def test_retry_after_failure_applies_results_once(db, monkeypatch):
+    generate = main.commentary_scheduler.generate
+    calls = []
+
+    async def flaky_generate(ctx, mode="auto"):
+        calls.append(mode)
+        if len(calls) == 1:
+            raise RuntimeError("commentary backend down")
+        return await generate(ctx, mode)
+
+    monkeypatch.setattr(main.commentary_scheduler, "generate", flaky_generate)
+
+    async def scenario():
+        await seed_final(db)
+        with pytest.raises(RuntimeError):
+            await main.run_simulation("match_final", "bulk")
+        released = await db.matches.find_one({"_id": "match_final"})
+        assert released["status"] == "pending"
+
+        await main.run_simulation("match_final", "bulk")
+        await assert_applied_once(db)
+
+    asyncio.run(scenario())
+
+
+def test_claim_takeover_applies_results_once(db, monkeypatch):
+    generate = main.commentary_scheduler.generate
+    calls = []
+
+    async def stalled_generate(ctx, mode="auto"):
+        calls.append(mode)
+        if len(calls) == 1:
+            # the first worker stalls past the claim TTL; a second worker takes
+            # the claim over and finishes the match before the first one resumes
+            expired = datetime.utcnow() - timedelta(seconds=main.SIMULATE_CLAIM_TTL + 1)
+            await db.matches.update_one({"_id": "match_final"}, {"$set": {"claimedAt": expired}})
+            await main.run_simulation("match_final", "bulk")
+        return await generate(ctx, mode)
+
+    monkeypatch.setattr(main.commentary_scheduler, "generate", stalled_generate)
+
+    async def scenario():
+        await seed_final(db)
+        stale = await main.run_simulation("match_final", "bulk")
+        assert stale["status"] == "simulated"
+        await assert_applied_once(db)
+
+    asyncio.run(scenario())
+
+
+def test_side_effects_replayed_after_crash(db, monkeypatch):
+    record_match_rollups = main.record_match_rollups
+    calls = []
+
+    async def crashing_rollups(match):
+        calls.append(match["_id"])
+        if len(calls) == 1:
+            raise RuntimeError("worker died")
+        await record_match_rollups(match)
+
+    monkeypatch.setattr(main, "record_match_rollups", crashing_rollups)
+
+    async def scenario():
+        await seed_final(db)
+        with pytest.raises(RuntimeError):
+            await main.run_simulation("match_final", "bulk")
+        match = await db.matches.find_one({"_id": "match_final"})
+        assert match["status"] == "simulated"
+        assert match["sideEffectsApplied"] is False
+
+        await main.advance_tournament_round("tour_1")
+        await assert_applied_once(db)
+        assert (await db.matches.find_one({"_id": "match_final"}))["sideEffectsApplied"] is True
+
+        # replaying a finished match changes nothing
+        await main.apply_match_effects(await db.matches.find_one({"_id": "match_final"}))
+        await assert_applied_once(db)
+
+    asyncio.run(scenario())